@@ -39,6 +39,7 @@ export default function LessonPage() {
     word: string;
     is_correct: boolean;
     question: string;
+    question_type?: string;
   }>) => {
     if (!user || !lesson) return;
 
@@ -42,6 +42,7 @@ export default function PodcastLessonPage() {
         word: string;
         is_correct: boolean;
         question: string;
+        question_type?: string;
     }>) => {
         if (!user || !lesson) return;
 
@@ -1,21 +1,72 @@
 import firebase_admin
-from firebase_admin import credentials, auth, firestore, storage
-import json
+from firebase_admin import credentials, firestore, storage
+from google.api_core import exceptions as google_exceptions
+import orjson
+import functools
+import pathlib
 import requests
-from typing import Optional, Dict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, List
 import webbrowser
 import http.server
 import socketserver
 import threading
 import urllib.parse
-import secrets
 import time
 import os
+import logging
+from collections import deque
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
+# Credentials file paths from environment variables, or defaults
+CREDS_FILE = os.getenv('FIREBASE_CREDENTIALS', 'firebase_credentials.json')
+WEB_CONFIG_FILE = os.getenv('FIREBASE_WEB_CONFIG', 'firebase_web_config.json')
+STORAGE_BUCKET = 'japanesetutor-27910.firebasestorage.app'
+AUTH_TIMEOUT = 300  # 5 minutes
+
+# Write payload templates, the sentinels are immutable and shared by every write
+_INCREMENT_ONE = firestore.Increment(1)
+_NOW = firestore.SERVER_TIMESTAMP
+_WORD_TEMPLATE = {
+    'reading': None,
+    'meaning': None,
+    'context': '',
+    'encounter_count': _INCREMENT_ONE,
+    'last_seen': _NOW,
+    'confidence_level': 0,
+    'notes': ''
+}
+# A partial payload must not record a finished, perfect lesson
+_PROGRESS_TEMPLATE = {
+    'completed': False,
+    'score': 0,
+    'lesson_type': 'regular',
+    'timestamp': _NOW
+}
+
+_REDIRECT_URI_TEMPLATE = "http://localhost:{port}/callback"
+OAUTH_CALLBACK_PORTS = (8000, 8100, 8200, 8300, 8400, 8500, 8600, 8700, 8800, 8900)
+_OAUTH_ENDPOINT = "https://accounts.google.com/o/oauth2/v2/auth"
+_OAUTH_PARAMS = {
+    'response_type': 'code',
+    'scope': 'email profile',
+    'access_type': 'offline'
+}
+
+# Firestore rejects batches over 500 operations, flush a little before that
+MAX_BATCH_OPS = 450
+COMMIT_WORKERS = 10
+COMMIT_RETRIES = 5
+USER_WORDS_CACHE_TTL = 60
+
 class OAuthCallbackHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, auth_callback, *args, **kwargs):
         self.auth_callback = auth_callback
@@ -37,16 +88,20 @@ class OAuthCallbackHandler(http.server.SimpleHTTPRequestHandler):
             if 'code' in params:
                 self.auth_callback(params['code'][0])
 
+@functools.lru_cache(maxsize=1)
+def _load_web_config(path: str) -> Dict:
+    """Read and parse the web config once per process"""
+    return orjson.loads(pathlib.Path(path).read_bytes())
+
+class ReusableTCPServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
 class FirebaseManager:
     def __init__(self):
-        # Get the credentials file path from environment variable or use default
-        creds_file = os.getenv('FIREBASE_CREDENTIALS', 'firebase_credentials.json')
-        web_config_file = os.getenv('FIREBASE_WEB_CONFIG', 'firebase_web_config.json')
-        
         # Initialize Firebase Admin SDK
         try:
-            cred = credentials.Certificate(creds_file)
-            bucket_name = 'japanesetutor-27910.firebasestorage.app'
+            cred = credentials.Certificate(CREDS_FILE)
+            bucket_name = STORAGE_BUCKET
             if not firebase_admin._apps:  # Only initialize if not already initialized
                 firebase_admin.initialize_app(cred, {
                     'storageBucket': bucket_name
@@ -55,122 +110,139 @@ class FirebaseManager:
             self.storage = storage.bucket(bucket_name)
             
             # Load web credentials for client auth
-            with open(web_config_file, 'r') as f:
-                self.web_config = json.load(f)
+            self.web_config = _load_web_config(WEB_CONFIG_FILE)
+            self._client_id = self.web_config['clientId']
             
             self.current_user = None
             self.auth_code = None
             self.server = None
+            self._auth_event = threading.Event()
+            
+            # Pooled keep-alive session shared by the OAuth/identity calls
+            self._http = requests.Session()
+            self._http.mount('https://', HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=20,
+                max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+            ))
+            
+            # Pending writes accumulated into a single batch commit
+            self._batch = self.db.batch()
+            self._pending = deque()
+            self._batch_lock = threading.Lock()
+            self._pool = ThreadPoolExecutor(max_workers=COMMIT_WORKERS)
+            self._inflight: List[Future] = []
+            
+            # Recent get_user_words results, keyed by (user_id, limit)
+            self._words_cache = TTLCache(maxsize=4096, ttl=USER_WORDS_CACHE_TTL)
+            self._words_cache_lock = threading.Lock()
             
         except Exception as e:
-            print(f"Error initializing Firebase: {str(e)}")
+            logger.error("Error initializing Firebase: %s", e)
             raise
         
     def start_auth_server(self):
         """Start local server to handle OAuth callback"""
-        # Try ports in sequence instead of random
-        ports = [8000, 8100, 8200, 8300, 8400, 8500, 8600, 8700, 8800, 8900]
-        
-        for port in ports:
+        handler = lambda *args: OAuthCallbackHandler(self.handle_auth_code, *args)
+        # Only these callback ports are registered as redirect URIs on the web client
+        for port in OAUTH_CALLBACK_PORTS:
             try:
-                handler = lambda *args: OAuthCallbackHandler(self.handle_auth_code, *args)
-                self.server = socketserver.TCPServer(("", port), handler)
-                
-                # Start server in a separate thread
-                server_thread = threading.Thread(target=self.server.serve_forever)
-                server_thread.daemon = True
-                server_thread.start()
-                
-                return port
+                self.server = ReusableTCPServer(("", port), handler)
+                break
             except OSError:
                 continue  # Port is in use, try next one
+        else:
+            raise RuntimeError("Could not find an available port")
+        self.server.timeout = AUTH_TIMEOUT
+        
+        # Serve in a separate thread until the callback arrives
+        server_thread = threading.Thread(target=self._serve_until_callback, args=(self.server,))
+        server_thread.daemon = True
+        server_thread.start()
         
-        raise RuntimeError("Could not find an available port")
+        return port
+    
+    def _serve_until_callback(self, server):
+        """Handle requests one at a time until the auth code arrives, then close the server"""
+        deadline = time.monotonic() + AUTH_TIMEOUT
+        with server:
+            # Loop so stray requests (e.g. favicon) don't end the flow early
+            while not self._auth_event.is_set() and time.monotonic() < deadline:
+                server.handle_request()
+        if self.server is server:
+            self.server = None
     
     def handle_auth_code(self, code):
         """Handle the authentication code from Google"""
         self.auth_code = code
-        # Start server shutdown in a separate thread
-        threading.Thread(target=self._shutdown_server).start()
-    
-    def _shutdown_server(self):
-        """Shutdown the server in a non-blocking way"""
-        if self.server:
-            self.server.shutdown()
-            self.server.server_close()
-            self.server = None
+        self._auth_event.set()
     
     def sign_in_with_google(self) -> Optional[Dict]:
         """Handle Google Sign-in using browser"""
         try:
-            print("Starting Google Sign-in process...")
+            logger.info("Starting Google Sign-in process...")
+            self.auth_code = None
+            self._auth_event.clear()
             # Start local server for OAuth callback
             port = self.start_auth_server()
-            print(f"OAuth callback server started on port {port}")
+            logger.info("OAuth callback server started on port %d", port)
             
             # Construct OAuth URL
-            oauth_url = (
-                "https://accounts.google.com/o/oauth2/v2/auth?"
-                f"client_id={self.web_config['clientId']}&"
-                "response_type=code&"
-                f"redirect_uri=http://localhost:{port}/callback&"
-                "scope=email%20profile&"
-                "access_type=offline"
-            )
+            redirect_uri = _REDIRECT_URI_TEMPLATE.format(port=port)
+            oauth_url = f"{_OAUTH_ENDPOINT}?" + urllib.parse.urlencode({
+                'client_id': self._client_id,
+                'redirect_uri': redirect_uri,
+                **_OAUTH_PARAMS
+            }, quote_via=urllib.parse.quote)
             
-            print("Opening browser for authentication...")
+            logger.info("Opening browser for authentication...")
             webbrowser.open(oauth_url)
             
             # Wait for authentication
-            timeout = 300  # 5 minutes
-            start_time = time.time()
-            while not self.auth_code and time.time() - start_time < timeout:
-                time.sleep(0.1)
-            
-            if not self.auth_code:
-                print("Authentication timed out")
+            if not self._auth_event.wait(timeout=AUTH_TIMEOUT):
+                logger.warning("Authentication timed out")
                 raise Exception("Authentication timed out")
             
-            print("Got auth code, exchanging for tokens...")
+            logger.info("Got auth code, exchanging for tokens...")
             # Exchange code for tokens
             token_url = "https://oauth2.googleapis.com/token"
             token_data = {
                 "code": self.auth_code,
-                "client_id": self.web_config['clientId'],
+                "client_id": self._client_id,
                 "client_secret": self.web_config['clientSecret'],
-                "redirect_uri": f"http://localhost:{port}/callback",
+                "redirect_uri": redirect_uri,
                 "grant_type": "authorization_code"
             }
             
-            response = requests.post(token_url, data=token_data)
-            print(f"Token exchange response status: {response.status_code}")
+            response = self._http.post(token_url, data=token_data)
+            logger.debug("Token exchange response status: %s", response.status_code)
             if response.status_code != 200:
-                print(f"Token exchange failed: {response.text}")
+                logger.warning("Token exchange failed: %s", response.text)
                 raise Exception("Failed to get access token")
             
             tokens = response.json()
-            print("Successfully got access token")
+            logger.debug("Successfully got access token")
             
             # Get user info
-            print("Getting user info...")
-            user_info_response = requests.get(
+            logger.debug("Getting user info...")
+            user_info_response = self._http.get(
                 "https://www.googleapis.com/oauth2/v2/userinfo",
                 headers={"Authorization": f"Bearer {tokens['access_token']}"}
             )
             
             if user_info_response.status_code != 200:
-                print(f"Failed to get user info: {user_info_response.text}")
+                logger.warning("Failed to get user info: %s", user_info_response.text)
                 raise Exception("Failed to get user info")
             
             user_info = user_info_response.json()
-            print(f"Got user info for: {user_info.get('email')}")
+            logger.info("Got user info for: %s", user_info.get('email'))
             
             # Sign in with Google OAuth token directly
-            print("Signing in to Firebase...")
-            response = requests.post(
+            logger.debug("Signing in to Firebase...")
+            response = self._http.post(
                 f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithIdp?key={self.web_config['apiKey']}",
                 json={
-                    "requestUri": f"http://localhost:{port}/callback",
+                    "requestUri": redirect_uri,
                     "postBody": f"access_token={tokens['access_token']}&providerId=google.com",
                     "returnSecureToken": True,
                     "returnIdpCredential": True
@@ -179,11 +251,11 @@ class FirebaseManager:
             
             if response.status_code != 200:
                 error_data = response.json()
-                print(f"Firebase sign-in failed: {error_data}")
+                logger.warning("Firebase sign-in failed: %s", error_data)
                 raise Exception(f"Failed to sign in: {error_data.get('error', {}).get('message', 'Unknown error')}")
             
             firebase_user = response.json()
-            print("Successfully signed in to Firebase")
+            logger.info("Successfully signed in to Firebase")
             
             self.current_user = {
                 'localId': firebase_user['localId'],
@@ -194,22 +266,16 @@ class FirebaseManager:
             }
             
             # Create or update user document
-            print("Updating user document in Firestore...")
+            logger.debug("Updating user document in Firestore...")
             self.update_user_data(self.current_user)
-            print("User document updated")
+            logger.debug("User document updated")
             
             return self.current_user
             
         except Exception as e:
-            print(f"Error during authentication: {str(e)}")
-            import traceback
-            print("Traceback:")
-            traceback.print_exc()
+            logger.exception("Error during authentication: %s", e)
             return None
-        finally:
-            # Remove server shutdown from here since it's handled in handle_auth_code
-            pass
-    
+
     def update_user_data(self, user_data: Dict):
         """Update or create user document in Firestore"""
         user_ref = self.db.collection('users').document(user_data['localId'])
@@ -220,42 +286,112 @@ class FirebaseManager:
             'lastLogin': firestore.SERVER_TIMESTAMP
         }, merge=True)
     
+    def _queue_set(self, ref, payload: Dict):
+        """Add a merge write to the pending batch, committing when it gets full"""
+        with self._batch_lock:
+            self._batch.set(ref, payload, merge=True)
+            self._pending.append((ref, payload))
+            full = len(self._pending) >= MAX_BATCH_OPS
+        if full:
+            self.flush()
+    
+    def flush(self) -> Optional[Future]:
+        """Commit all pending batched writes in the background"""
+        with self._batch_lock:
+            self._inflight = [f for f in self._inflight if not f.done()]
+            if not self._pending:
+                return None
+            batch = self._batch
+            self._batch = self.db.batch()
+            self._pending.clear()
+            future = self._pool.submit(self._commit_with_retry, batch)
+            self._inflight.append(future)
+        return future
+    
+    def _commit_with_retry(self, batch):
+        """Commit a batch, backing off on transient Firestore errors"""
+        for attempt in range(COMMIT_RETRIES):
+            try:
+                return batch.commit()
+            except (google_exceptions.Aborted, google_exceptions.DeadlineExceeded) as e:
+                if attempt == COMMIT_RETRIES - 1:
+                    logger.error("Batch commit failed after %d attempts: %s", COMMIT_RETRIES, e)
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
+    
+    def drain(self):
+        """Flush pending writes and wait for every in-flight commit to finish"""
+        self.flush()
+        with self._batch_lock:
+            inflight, self._inflight = self._inflight, []
+        wait(inflight)
+    
     def save_word(self, user_id: str, word_data: Dict):
-        """Save a word to user's vocabulary"""
+        """Save a word to user's vocabulary (batched, see flush)"""
         word_ref = (self.db.collection('users')
                    .document(user_id)
                    .collection('vocabulary')
                    .document(word_data['word']))
         
-        word_ref.set({
-            'reading': word_data['reading'],
-            'meaning': word_data['meaning'],
-            'context': word_data.get('context', ''),
-            'encounter_count': firestore.Increment(1),
-            'last_seen': firestore.SERVER_TIMESTAMP,
-            'confidence_level': word_data.get('confidence_level', 0),
-            'notes': word_data.get('notes', '')
-        }, merge=True)
+        # Drop cached word lists for this user so the next read sees the new word
+        with self._words_cache_lock:
+            for key in [key for key in self._words_cache if key[0] == user_id]:
+                self._words_cache.pop(key, None)
+        
+        payload = _WORD_TEMPLATE.copy()
+        payload['reading'] = word_data['reading']
+        payload['meaning'] = word_data['meaning']
+        payload['context'] = word_data.get('context', '')
+        payload['confidence_level'] = word_data.get('confidence_level', 0)
+        payload['notes'] = word_data.get('notes', '')
+        self._queue_set(word_ref, payload)
     
     def get_user_words(self, user_id: str, limit: int = 50) -> list:
         """Get user's saved words"""
+        key = (user_id, limit)
+        with self._words_cache_lock:
+            cached = self._words_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        
         words_ref = (self.db.collection('users')
                     .document(user_id)
                     .collection('vocabulary')
                     .order_by('last_seen', direction=firestore.Query.DESCENDING)
                     .limit(limit))
         
-        return [doc.to_dict() for doc in words_ref.stream()]
+        words = [doc.to_dict() for doc in words_ref.stream()]
+        with self._words_cache_lock:
+            self._words_cache[key] = words
+        return list(words)
+    
+    def get_user_docs_bulk(self, user_id: str, collection: str, doc_ids: List[str],
+                           field_paths: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Fetch several documents from a user subcollection in one get_all round-trip"""
+        if not doc_ids:
+            return {}
+        user_collection = self.db.collection('users').document(user_id).collection(collection)
+        refs = [user_collection.document(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+        return {snap.id: snap.to_dict()
+                for snap in self.db.get_all(refs, field_paths=field_paths) if snap.exists}
+    
+    def get_words_bulk(self, user_id: str, words: List[str]) -> Dict[str, Dict]:
+        """Get several of the user's saved words at once, keyed by word"""
+        return self.get_user_docs_bulk(user_id, 'vocabulary', words)
     
     def save_lesson_progress(self, user_id: str, lesson_data: Dict):
-        """Save user's lesson progress"""
+        """Save user's lesson progress (batched, see flush)"""
+        lesson_type = lesson_data.get('lesson_type', 'regular')
+        collection_name = 'lesson_progress' if lesson_type == 'regular' else 'podcast_progress'
+        lesson_number = lesson_data.get('lesson_number', lesson_data.get('episode_number'))
+        
         progress_ref = (self.db.collection('users')
                        .document(user_id)
-                       .collection('lesson_progress')
-                       .document(str(lesson_data['lesson_number'])))
+                       .collection(collection_name)
+                       .document(str(lesson_number)))
         
-        progress_ref.set({
-            'completed': lesson_data['completed'],
-            'score': lesson_data.get('score', 0),
-            'timestamp': firestore.SERVER_TIMESTAMP
-        }, merge=True) 
\ No newline at end of file
+        payload = _PROGRESS_TEMPLATE.copy()
+        payload['completed'] = lesson_data.get('completed', payload['completed'])
+        payload['score'] = lesson_data.get('score', payload['score'])
+        payload['lesson_type'] = lesson_type
+        self._queue_set(progress_ref, payload)
@@ -1,18 +1,32 @@
 import json
 from dataclasses import dataclass
 from typing import List, Dict, Optional, Literal
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import sqlite3
-import requests
-from collections import defaultdict
+import asyncio
+import contextlib
+import threading
+import aiohttp
+from itertools import chain
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 import re
 import time
 from firebase_admin import firestore
-from google.cloud import texttospeech
+from google.cloud import texttospeech, texttospeech_v1beta1
+from pydub import AudioSegment
+from xml.sax.saxutils import escape as xml_escape
 import base64
+import functools
+import hashlib
+import io
+import logging
 import os
-import urllib.parse
 import random
+import heapq
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 @dataclass
 class VocabularyItem:
@@ -23,25 +37,382 @@ class VocabularyItem:
     context: Optional[str] = None
     audio_url: Optional[str] = None
 
+_JSON_DECODER = json.JSONDecoder()
+
+@functools.lru_cache(maxsize=4096)
+def _audio_path(text: str) -> str:
+    """Storage path for the audio of text"""
+    return f"audio/{base64.urlsafe_b64encode(text.encode()).decode()}.mp3"
+
+_rng = np.random.default_rng()
+
+# Upper bound on concurrent LLM requests shared by every caller of a tutor
+MAX_CONCURRENT_API_CALLS = 10
+
+# Successful API responses are cached on disk, keyed by sha256(provider|model|prompt);
+# JSON mode replies are only cached once they parse
+API_CACHE_PATH = os.getenv('TUTOR_CACHE_PATH', '.tutor_cache.sqlite')
+API_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Concurrent TTS requests per tutor
+MAX_CONCURRENT_AUDIO = 8
+
+# Cache-Control sent with uploaded word audio
+AUDIO_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+TTS_VOICE = "ja-JP-Neural2-B"
+TTS_SPEAKING_RATE = 0.85
+# Pause between words synthesized together, kept at the end of each word's clip
+TTS_BATCH_BREAK_MS = 500
+# SSML bytes per batched TTS request, under the API's 5000 byte input limit
+TTS_BATCH_MAX_BYTES = 4500
+
+# Words practiced in one podcast lesson, bounds prompt size and audio generation
+PODCAST_LESSON_WORDS = 5
+
+# Seconds a user's mastered word set is served from memory
+MASTERED_CACHE_TTL = 60
+# Seconds a user's recently practiced words are reused across lesson builders
+RECENT_WORDS_CACHE_TTL = 60
+
+SECONDS_PER_DAY = 86400.0
+
+# Word progress fields read when scoring words to learn
+PROGRESS_FIELDS = [
+    'total_meaning_attempts', 'meaning_correct_count', 'meaning_correct_streak',
+    'total_reading_attempts', 'reading_correct_count', 'reading_correct_streak',
+    'last_seen',
+]
+
+# Lesson generation prompts, filled with str.format(words=...); the indentation is part
+# of the prompt text and of its API cache key
+_LESSON_PROMPT = """
+        Create a Japanese lesson with multiple-choice questions using these words.
+        For each word, create both a meaning question and a reading question.
+        
+        Words to learn:
+        {words}
+        
+        Return a JSON object with this structure:
+        {{
+            "exercises": [
+                {{
+                    "type": "multiple_choice",
+                    "word": "<japanese_word>",
+                    "reading": "<reading>",
+                    "meaning": "<english_meaning>",
+                    "question": "<question in English>",
+                    "options": ["<option1>", "<option2>", "<option3>", "<option4>"],
+                    "correct": "<correct answer>"
+                }}
+            ]
+        }}
+        
+        For each word, create two types of questions:
+        1. Meaning question: "What does [japanese_word] mean?"
+        2. Reading question:
+           - If the word contains kanji: "How do you read [japanese_word]?" with hiragana options
+           - If the word is only hiragana: "How do you write [japanese_word] in romaji?" with romaji options
+        """
+
+_PODCAST_LESSON_PROMPT = """
+        Create a Japanese lesson based on these vocabulary items from a podcast.
+        For each word, create both a meaning question and a reading question.
+        
+        Words to learn:
+        {words}
+        
+        Return a JSON object with this structure:
+        {{
+            "vocabulary": [
+                {{
+                    "word": "<japanese>",
+                    "reading": "<hiragana>",
+                    "romaji": "<romaji>",
+                    "meaning": "<english>",
+                    "context": "<japanese sentence from transcript>",
+                    "context_en": "<english translation>",
+                    "explanation": "<usage explanation>"
+                }}
+            ],
+            "exercises": [
+                {{
+                    "type": "multiple_choice",
+                    "word": "<japanese_word>",
+                    "reading": "<hiragana>",
+                    "romaji": "<romaji>",
+                    "meaning": "<english_meaning>",
+                    "question": "<question in English>",
+                    "options": ["<option1>", "<option2>", "<option3>", "<option4>"],
+                    "correct": "<correct answer>",
+                    "context": "<example sentence>",
+                    "context_en": "<english translation>"
+                }}
+            ]
+        }}
+        
+        For each word, create two types of questions:
+        1. Meaning question: "What does [japanese_word] mean?"
+        2. Reading question: "How do you pronounce [japanese_word]?"
+           - Always use romaji for pronunciation answers
+           - Include both hiragana and romaji in the question data
+        
+        IMPORTANT RULES:
+        1. Each question MUST have exactly 4 options
+        2. The correct answer MUST be included in the options
+        3. For meaning questions, use English words as options
+        4. For reading questions, use ONLY romaji options
+        5. Always include the Japanese word in the question
+        6. Include relevant example sentences from the transcript when possible
+        7. Provide clear, natural English translations
+        """
+
+# Cleanup of podcast lesson JSON: parenthesised asides, then whitespace runs. The
+# collapse also turns raw newlines inside strings into spaces, which json.loads rejects
+_PAREN_RE = re.compile(r'\([^)]*\)')
+_WS_RE = re.compile(r'\s+')
+
+# Reset durations in rate limit headers look like "1s", "6m0s" or "20ms"
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def exercise_question_type(question: str) -> str:
+    """Progress track an exercise question counts towards, 'meaning' or 'reading'"""
+    # Meaning questions are "What does [word] mean?", every other kind tests the reading
+    return 'meaning' if 'mean' in question.lower() else 'reading'
+
+def _parse_duration(value: Optional[str]) -> float:
+    """Parse a rate limit reset/Retry-After header value into seconds"""
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return sum(float(n) * _DURATION_UNITS[unit] for n, unit in _DURATION_PART.findall(value))
+
+class RateLimiter:
+    """AIMD concurrency limit for API calls, driven by the provider's rate limit headers
+
+    Concurrency grows by ~1 per round of successful calls and halves on 429/5xx or
+    network errors. New calls are held back while a Retry-After is in effect or when
+    fewer than 10% of the provider's request quota remains until its reset.
+    """
+    ERROR_PAUSE = 1.0
+    LOW_QUOTA_FRACTION = 0.1
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self._concurrency = float(max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._condition = asyncio.Condition()
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.min_concurrency, int(self._concurrency))
+
+    def _pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def wait_if_throttled(self):
+        """Sleep until any active pause has elapsed"""
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one of the currently allowed concurrent request slots"""
+        await self.wait_if_throttled()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.concurrency)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def _decrease(self):
+        self._concurrency = max(self.min_concurrency, self._concurrency / 2)
+
+    def on_response(self, status: int, headers):
+        """Adjust the limit from a response status and its rate limit headers"""
+        if status == 429 or status >= 500:
+            self._decrease()
+            self._pause(_parse_duration(headers.get('Retry-After')) or self.ERROR_PAUSE)
+            return
+        if status == 200:
+            self._concurrency = min(self.max_concurrency, self._concurrency + 1 / self._concurrency)
+        
+        remaining = headers.get('x-ratelimit-remaining-requests')
+        limit = headers.get('x-ratelimit-limit-requests')
+        if remaining and limit and int(remaining) < int(limit) * self.LOW_QUOTA_FRACTION:
+            self._pause(_parse_duration(headers.get('x-ratelimit-reset-requests')))
+
+    def on_error(self):
+        """Back off after a timeout or connection error"""
+        self._decrease()
+        self._pause(self.ERROR_PAUSE)
+
+# Firestore's limit on writes per batch commit
+MAX_BATCH_OPS = 500
+
+# Lessons draw from the most frequent words, kept in memory instead of paged per lesson
+FREQUENCY_INDEX_SIZE = 5000
+FREQUENCY_INDEX_TTL = 60 * 60
+
 class JapaneseTutor:
+    # Shared by all tutors in the process, see _load_frequency_index
+    _frequency_index = None
+    _frequency_index_loaded_at = 0
+    _frequency_index_lock = threading.Lock()
+    
+    # Storage paths known to already hold audio, skips even the exists() check.
+    # Shared by all tutors in the process and warmed from a bucket listing, see _warm_audio_cache
+    _uploaded_audio = set()
+    _audio_cache_warmed = False
+    _audio_cache_lock = threading.Lock()
+    
+    # Filler options for exercises the model returned with fewer than 4
+    _DUMMY_ROMAJI = ('ka', 'ki', 'ku', 'ke', 'ko', 'sa', 'shi', 'su', 'se', 'so')
+    _DUMMY_MEANINGS = ('thing', 'place', 'action', 'time', 'person', 'object', 'idea', 'feeling')
+    
     def __init__(self, api_key: str, firebase_manager, api_provider: Literal["openai", "deepseek"] = "openai"):
         self.api_key = api_key
         self.firebase = firebase_manager
         self.api_provider = api_provider
         self.tts_client = None
+        self.tts_beta_client = None
         try:
             self.tts_client = texttospeech.TextToSpeechClient()
+            # Only the beta API returns SSML mark timepoints, see _synthesize_many
+            self.tts_beta_client = texttospeech_v1beta1.TextToSpeechClient()
         except Exception as e:
-            print(f"Warning: Could not initialize Text-to-Speech client: {e}")
+            logger.warning("Could not initialize Text-to-Speech client: %s", e)
         
-    def call_api(self, prompt: str) -> str:
-        """Call API with proper error handling and retries"""
-        print("\nCalling API...")
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        # API calls run on a private event loop thread, started on first use
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._session = None
+        self._rate_limiter = None
+        
+        # Independent per-user Firestore reads are issued concurrently on this pool
+        self._read_pool = ThreadPoolExecutor(max_workers=4)
+        # Audio generation deferred off the request path, see create_podcast_lesson
+        self._background_pool = ThreadPoolExecutor(max_workers=2)
+        # TTS synthesis + Storage upload per word, bounded to respect the TTS quota
+        self._audio_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_AUDIO)
+        # Recent get_user_mastered_words results, keyed by user_id
+        self._mastered_cache = TTLCache(maxsize=1024, ttl=MASTERED_CACHE_TTL)
+        self._mastered_cache_lock = threading.Lock()
+        # Recent _get_recent_word_ids results, keyed by (user_id, hours)
+        self._recent_cache = TTLCache(maxsize=1024, ttl=RECENT_WORDS_CACHE_TTL)
+        self._recent_cache_lock = threading.Lock()
+        # Frequency dictionary entries are read-only, so lookups by word are memoized
+        self._get_word_details = functools.lru_cache(maxsize=4096)(self._fetch_word_details)
+        
+        self._read_pool.submit(self._warm_audio_cache)
         
+        self._cache_lock = threading.Lock()
+        self._cache_db = sqlite3.connect(API_CACHE_PATH, check_same_thread=False)
+        self._cache_db.execute("PRAGMA journal_mode=WAL")
+        self._cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS api_cache (key TEXT PRIMARY KEY, response TEXT, ts INTEGER)"
+        )
+        self._cache_db.commit()
+    
+    def _cache_get(self, key: str) -> Optional[str]:
+        """Return a cached API response if it is still fresh"""
+        with self._cache_lock:
+            row = self._cache_db.execute(
+                "SELECT response FROM api_cache WHERE key = ? AND ts >= ?",
+                (key, int(time.time()) - API_CACHE_TTL)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def _cache_key(self, prompt: str, json_mode: bool) -> str:
+        """API cache key of a prompt for the configured provider and model"""
+        model = "gpt-4o-mini" if self.api_provider == "openai" else "deepseek-chat"
+        return hashlib.sha256(
+            f"{self.api_provider}|{model}|{'json|' if json_mode else ''}{prompt}".encode()
+        ).hexdigest()
+    
+    def _cache_put(self, key: str, response: str):
+        with self._cache_lock:
+            self._cache_db.execute(
+                "INSERT OR REPLACE INTO api_cache (key, response, ts) VALUES (?, ?, ?)",
+                (key, response, int(time.time()))
+            )
+            self._cache_db.commit()
+    
+    def cache_response(self, prompt: str, response: str, json_mode: bool = False):
+        """Cache a response fetched with cache=False once the caller has validated it"""
+        self._cache_put(self._cache_key(prompt, json_mode), response)
+    
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the tutor's API event loop, starting its thread if needed"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+    
+    def _run(self, coro):
+        """Run a coroutine on the API loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared aiohttp session (must be called on the API loop)"""
+        if self._session is None:
+            # One keep-alive connection pool per tutor, auth headers set once
+            self._session = aiohttp.ClientSession(
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                connector=aiohttp.TCPConnector(limit=MAX_CONCURRENT_API_CALLS, keepalive_timeout=60)
+            )
+            self._rate_limiter = RateLimiter(MAX_CONCURRENT_API_CALLS)
+        return self._session
+    
+    @staticmethod
+    def _is_json(content: str) -> bool:
+        """Whether content parses as JSON"""
+        try:
+            json.loads(content)
+        except ValueError:
+            return False
+        return True
+    
+    def close(self):
+        """Close the HTTP session and stop the API loop"""
+        if self._loop is None:
+            return
+        if self._session is not None:
+            self._run(self._session.close())
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+    
+    def call_api(self, prompt: str, json_mode: bool = False, cache: bool = True) -> str:
+        """Call API with proper error handling and retries"""
+        return self._run(self.call_api_async(prompt, json_mode, cache))
+    
+    def call_api_many(self, prompts: List[str], json_mode: bool = False,
+                      return_exceptions: bool = False, cache: bool = True) -> List:
+        """Call the API for several prompts concurrently, results in prompt order"""
+        async def gather():
+            return await asyncio.gather(
+                *(self.call_api_async(prompt, json_mode, cache) for prompt in prompts),
+                return_exceptions=return_exceptions
+            )
+        return self._run(gather())
+    
+    async def call_api_async(self, prompt: str, json_mode: bool = False, cache: bool = True) -> str:
+        """Call API with proper error handling and retries, bounded by MAX_CONCURRENT_API_CALLS"""
+        logger.debug("Calling API...")
         if self.api_provider == "openai":
             data = {
                 "model": "gpt-4o-mini",
@@ -68,121 +439,174 @@ class JapaneseTutor:
                 "max_tokens": 4000
             }
             api_url = "https://api.deepseek.com/v1/chat/completions"
+        if json_mode:
+            # Ask for a single JSON object, both providers require the prompt to mention JSON
+            data["response_format"] = {"type": "json_object"}
+        
+        cache_key = self._cache_key(prompt, json_mode)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.debug("API cache hit, got response of length: %d", len(cached))
+            return cached
         
         max_retries = 3
-        timeout = 30
+        timeout = aiohttp.ClientTimeout(total=30)
+        session = self._get_session()
         
         for attempt in range(max_retries):
             try:
-                print(f"API attempt {attempt + 1}/{max_retries}")
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=data,
-                    timeout=timeout
-                )
-                
-                if response.status_code == 429:  # Rate limit
-                    retry_after = int(response.headers.get('Retry-After', 5))
-                    print(f"Rate limited. Waiting {retry_after} seconds...")
-                    time.sleep(retry_after)
-                    continue
-                    
-                if response.status_code != 200:
-                    print(f"API error: Status {response.status_code}")
-                    print(f"Response: {response.text}")
-                    raise Exception(f"API error: {response.text}")
-                
-                content = response.json()["choices"][0]["message"]["content"]
-                print(f"API call successful, got response of length: {len(content)}")
-                return content
+                logger.debug("API attempt %d/%d", attempt + 1, max_retries)
+                async with self._rate_limiter.slot():
+                    async with session.post(api_url, json=data, timeout=timeout) as response:
+                        self._rate_limiter.on_response(response.status, response.headers)
+                        if response.status == 429:  # Rate limit
+                            # The limiter pauses new requests for Retry-After, just try again
+                            logger.warning("Rate limited, concurrency now %d", self._rate_limiter.concurrency)
+                            continue
+                        if response.status != 200:
+                            text = await response.text()
+                            logger.error("API error: Status %s, response: %s", response.status, text)
+                            raise Exception(f"API error: {text}")
+                        content = (await response.json())["choices"][0]["message"]["content"]
+                        logger.debug("API call successful, got response of length: %d", len(content))
+                        # cache=False callers store the reply with cache_response once validated
+                        if cache and (not json_mode or self._is_json(content)):
+                            self._cache_put(cache_key, content)
+                        return content
                 
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred on attempt {attempt + 1}")
+            except asyncio.TimeoutError:
+                logger.warning("Timeout occurred on attempt %d", attempt + 1)
+                self._rate_limiter.on_error()
                 if attempt == max_retries - 1:
                     raise Exception(f"API timeout after {max_retries} attempts")
-                print(f"Retrying... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(2 ** attempt)
+                logger.debug("Retrying... (attempt %d/%d)", attempt + 1, max_retries)
                 
-            except requests.exceptions.RequestException as e:
-                print(f"Request error on attempt {attempt + 1}: {str(e)}")
+            except aiohttp.ClientError as e:
+                logger.warning("Request error on attempt %d: %s", attempt + 1, e)
+                self._rate_limiter.on_error()
                 if attempt == max_retries - 1:
                     raise Exception(f"API request failed: {str(e)}")
-                print(f"Retrying... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(2 ** attempt)
+                logger.debug("Retrying... (attempt %d/%d)", attempt + 1, max_retries)
+
+    @classmethod
+    def _load_frequency_index(cls, db) -> List[tuple]:
+        """Return (doc_ref, data) for the most frequent words in rank order, refreshed hourly"""
+        with cls._frequency_index_lock:
+            if (cls._frequency_index is None or
+                    time.time() - cls._frequency_index_loaded_at > FREQUENCY_INDEX_TTL):
+                docs = (db.collection('frequency_dictionary')
+                        .where('frequency_rank', '<=', FREQUENCY_INDEX_SIZE)
+                        .order_by('frequency_rank')
+                        .stream())
+                cls._frequency_index = [(doc.reference, doc.to_dict()) for doc in docs]
+                cls._frequency_index_loaded_at = time.time()
+                logger.info("Loaded %d words into the frequency index", len(cls._frequency_index))
+            return cls._frequency_index
 
-    def get_user_mastered_words(self, user_id: str) -> set:
-        """Get set of words mastered by the user"""
+    def get_user_mastered_words(self, user_id: str) -> frozenset:
+        """Get set of words mastered by the user (cached, see MASTERED_CACHE_TTL)"""
+        with self._mastered_cache_lock:
+            cached = self._mastered_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
         mastered_docs = (self.firebase.db.collection('users')
                         .document(user_id)
                         .collection('mastered_words')
+                        .select([])
                         .stream())
-        return {doc.id for doc in mastered_docs}
+        mastered = frozenset(doc.id for doc in mastered_docs)
+        with self._mastered_cache_lock:
+            self._mastered_cache[user_id] = mastered
+        return mastered
+
+    def _fetch_word_details(self, word: str) -> Optional[Dict]:
+        """Look up a word in the frequency dictionary, by document id first"""
+        dictionary = self.firebase.db.collection('frequency_dictionary')
+        word_doc = dictionary.document(word).get()
+        if word_doc.exists:
+            return word_doc.to_dict()
+        # Fall back to querying the 'word' field for documents keyed otherwise
+        for word_doc in dictionary.where('word', '==', word).limit(1).stream():
+            return word_doc.to_dict()
+        return None
 
-    def record_word_mastery(self, user_id: str, word: str, source: str):
-        """Record a word as mastered by the user"""
-        # First, find the word's document by querying
-        word_query = (self.firebase.db.collection('frequency_dictionary')
-                     .where('word', '==', word)
-                     .limit(1)
-                     .stream())
+    def record_word_mastery(self, user_id: str, word: str, source: str, batch=None) -> bool:
+        """Record a word as mastered by the user, queued on batch if one is given"""
+        word_data = self._get_word_details(word)
+        if word_data is None:
+            logger.warning("Word '%s' not found in frequency dictionary", word)
+            return False
         
-        try:
-            word_doc = next(word_query)
-            word_data = word_doc.to_dict()
-        except StopIteration:
-            # If not found by 'word' field, try direct document lookup
-            word_doc = self.firebase.db.collection('frequency_dictionary').document(word).get()
-            if not word_doc.exists:
-                print(f"Warning: Word '{word}' not found in frequency dictionary")
-                return
-            word_data = word_doc.to_dict()
+        with self._mastered_cache_lock:
+            self._mastered_cache.pop(user_id, None)
         
         # Save mastery record using actual word
-        self.firebase.db.collection('users')\
-            .document(user_id)\
-            .collection('mastered_words')\
-            .document(word)\
-            .set({
-                'mastered_date': firestore.SERVER_TIMESTAMP,
-                'source': source,
-                'review_count': 0,
-                'reading': word_data.get('reading', ''),
-                'meaning': word_data.get('meaning', '')
-            })
+        mastery_ref = (self.firebase.db.collection('users')
+                      .document(user_id)
+                      .collection('mastered_words')
+                      .document(word))
+        mastery_data = {
+            'mastered_date': firestore.SERVER_TIMESTAMP,
+            'source': source,
+            'review_count': 0,
+            'reading': word_data.get('reading', ''),
+            'meaning': word_data.get('meaning', '')
+        }
+        if batch is not None:
+            batch.set(mastery_ref, mastery_data)
+        else:
+            mastery_ref.set(mastery_data)
+        return True
 
     def get_next_words_to_learn(self, user_id: str, count: int = 5) -> List[VocabularyItem]:
         """Get next words to learn based on frequency, user's mastery, and learning progress"""
-        # Get mastered words
-        mastered_words = self.get_user_mastered_words(user_id)
-        print(f"User has mastered {len(mastered_words)} words")
+        # Fetch mastered, recently used and seen word ids in parallel
+        mastered_future = self._read_pool.submit(self.get_user_mastered_words, user_id)
+        recent_future = self._read_pool.submit(self._get_recent_word_ids, user_id)
+        seen_future = self._read_pool.submit(self.get_user_seen_words, user_id)
         
-        # Get user's word progress
-        current_time = datetime.now().timestamp()
-        cutoff_time = current_time - (24 * 60 * 60)  # 24 hours ago
+        mastered_words = mastered_future.result()
+        logger.debug("User has mastered %d words", len(mastered_words))
         
-        # Get all word progress
-        progress_ref = (self.firebase.db.collection('users')
-                       .document(user_id)
-                       .collection('word_progress')
-                       .stream())
+        current_time = time.time()
+        recent_words = recent_future.result()
         
-        word_progress = {}
-        recent_words = set()
+        logger.debug("Found %d recently used words to exclude", len(recent_words))
         
-        for doc in progress_ref:
-            data = doc.to_dict()
+        # Candidates are the unmastered, not recently used words of the frequency index
+        listed_words = set()  # Keep track of listed words to avoid duplicates
+        candidates = []
+        for doc_ref, data in self._load_frequency_index(self.firebase.db):
+            # Use document ID as word if 'word' field is missing
+            actual_word = data.get('word', doc_ref.id)
+            if actual_word in listed_words:
+                continue
+            listed_words.add(actual_word)
+            if actual_word in recent_words or actual_word in mastered_words:
+                continue
+            candidates.append((doc_ref, data, actual_word))
+        
+        logger.debug("Found %d candidate words to learn", len(candidates))
+        if not candidates:
+            return []
+        
+        # Only pull progress for candidates the user has actually seen
+        seen_words = seen_future.result()
+        progress_docs = self.firebase.get_user_docs_bulk(
+            user_id, 'word_progress',
+            [actual_word for _, _, actual_word in candidates if actual_word in seen_words],
+            field_paths=PROGRESS_FIELDS)
+        word_progress = {}
+        for word, data in progress_docs.items():
             # Convert Firestore timestamp to Unix timestamp if it exists
             last_seen = data.get('last_seen')
             if hasattr(last_seen, 'timestamp'):
                 last_seen = last_seen.timestamp()
-                # Check if word was used recently
-                if last_seen > cutoff_time:
-                    recent_words.add(doc.id)
             elif not last_seen:
                 last_seen = 0
-                
-            word_progress[doc.id] = {
+            
+            word_progress[word] = {
                 'total_meaning_attempts': data.get('total_meaning_attempts', 0),
                 'meaning_correct_count': data.get('meaning_correct_count', 0),
                 'meaning_correct_streak': data.get('meaning_correct_streak', 0),
@@ -192,170 +616,127 @@ class JapaneseTutor:
                 'last_seen': last_seen
             }
         
-        print(f"Found {len(recent_words)} recently used words to exclude")
+        # Score every candidate at once, one array per progress field
+        n = len(candidates)
+        ranks = np.array([data.get('frequency_rank', np.inf) for _, data, _ in candidates], dtype=np.float32)
+        meaning_attempts = np.zeros(n, dtype=np.float32)
+        meaning_correct = np.zeros(n, dtype=np.float32)
+        meaning_streak = np.zeros(n, dtype=np.float32)
+        reading_attempts = np.zeros(n, dtype=np.float32)
+        reading_correct = np.zeros(n, dtype=np.float32)
+        reading_streak = np.zeros(n, dtype=np.float32)
+        last_seen = np.zeros(n, dtype=np.float64)
+        for i, (_, _, actual_word) in enumerate(candidates):
+            progress = word_progress.get(actual_word)
+            if progress:
+                meaning_attempts[i] = progress['total_meaning_attempts']
+                meaning_correct[i] = progress['meaning_correct_count']
+                meaning_streak[i] = progress['meaning_correct_streak']
+                reading_attempts[i] = progress['total_reading_attempts']
+                reading_correct[i] = progress['reading_correct_count']
+                reading_streak[i] = progress['reading_correct_streak']
+                last_seen[i] = progress['last_seen'] or 0
         
-        # Keep track of seen words to avoid duplicates
-        seen_words = set()
-        words = []
-        last_rank = 0
-        batch_size = 50  # Process words in batches
+        # Calculate separate accuracy rates for meaning and reading
+        meaning_accuracy = np.divide(meaning_correct, meaning_attempts,
+                                     out=np.zeros(n, dtype=np.float32), where=meaning_attempts > 0)
+        reading_accuracy = np.divide(reading_correct, reading_attempts,
+                                     out=np.zeros(n, dtype=np.float32), where=reading_attempts > 0)
         
-        while len(words) < count and last_rank < 5000:  # Limit to first 5000 most frequent words
-            # Get next batch of words ordered by frequency_rank
-            words_ref = (self.firebase.db.collection('frequency_dictionary')
-                        .where('frequency_rank', '>', last_rank)
-                        .order_by('frequency_rank')
-                        .limit(batch_size))
-            
-            batch = list(words_ref.stream())
-            if not batch:
-                break
-            
-            for doc in batch:
-                data = doc.to_dict()
-                # Use document ID as word if 'word' field is missing
-                actual_word = data.get('word', doc.id)
-                current_rank = data.get('frequency_rank', float('inf'))
-                
-                # Update last_rank for next iteration
-                last_rank = current_rank
-                
-                # Skip if we've seen this word before (avoid duplicates)
-                if actual_word in seen_words:
-                    continue
-                seen_words.add(actual_word)
-                
-                # Skip if word was used recently
-                if actual_word in recent_words:
-                    print(f"Skipping recently used word: {actual_word}")
-                    continue
-                
-                if actual_word not in mastered_words:
-                    # Calculate word score based on detailed learning progress
-                    progress = word_progress.get(actual_word, {})
-                    
-                    # Calculate separate accuracy rates for meaning and reading
-                    meaning_attempts = progress.get('total_meaning_attempts', 0)
-                    meaning_correct = progress.get('meaning_correct_count', 0)
-                    meaning_accuracy = (meaning_correct / meaning_attempts) if meaning_attempts > 0 else 0
-                    
-                    reading_attempts = progress.get('total_reading_attempts', 0)
-                    reading_correct = progress.get('reading_correct_count', 0)
-                    reading_accuracy = (reading_correct / reading_attempts) if reading_attempts > 0 else 0
-                    
-                    # Calculate time since last practice
-                    time_factor = 0
-                    if progress.get('last_seen'):
-                        days_since_practice = (current_time - progress['last_seen']) / (24 * 60 * 60)
-                        # Increase priority for words not practiced in 3-7 days
-                        if 3 <= days_since_practice <= 7:
-                            time_factor = 500
-                    
-                    # Base score from frequency
-                    score = 1000 - (current_rank / 10)
-                    
-                    if meaning_attempts == 0 or reading_attempts == 0:
-                        # Highest priority for new words
-                        score += 2000
-                    else:
-                        # Priority based on accuracy - focus on words with low accuracy
-                        meaning_priority = 1000 * (1 - meaning_accuracy)
-                        reading_priority = 1000 * (1 - reading_accuracy)
-                        
-                        # Give extra weight to the type with lower accuracy
-                        score += max(meaning_priority, reading_priority)
-                        
-                        # Add bonus for words that need practice in both areas
-                        if meaning_accuracy < 0.7 and reading_accuracy < 0.7:
-                            score += 500
-                        
-                        # Consider streaks - prioritize words where streaks were recently broken
-                        if progress.get('meaning_correct_streak', 0) == 0 and meaning_attempts > 0:
-                            score += 300
-                        if progress.get('reading_correct_streak', 0) == 0 and reading_attempts > 0:
-                            score += 300
-                    
-                    # Add time factor
-                    score += time_factor
-                    
-                    # Add some randomness to break ties and provide variety
-                    score += random.uniform(0, 100)
-                    
-                    print(f"Word: {actual_word}, Score: {score:.2f} (Meaning acc: {meaning_accuracy:.2f}, Reading acc: {reading_accuracy:.2f}, Attempts: {meaning_attempts}/{reading_attempts})")
-                    
-                    # Generate audio URL if not present
-                    if not data.get('audio_url'):
-                        audio_url = self.generate_audio(actual_word)
-                        if audio_url:
-                            data['audio_url'] = audio_url
-                            # Update the frequency dictionary with the audio URL
-                            doc.reference.update({'audio_url': audio_url})
-                    
-                    # Add word to list with its score
-                    words.append((score, VocabularyItem(
-                        word=actual_word,
-                        reading=data.get('reading', ''),
-                        meaning=data.get('meaning', ''),
-                        audio_url=data.get('audio_url'),
-                        frequency_rank=current_rank
-                    )))
-                    
-                    if len(words) >= count:
-                        break
-        
-        print(f"Found {len(words)} candidate words to learn")
-        
-        # Sort words by score (highest first) and take top count words
-        words.sort(key=lambda x: x[0], reverse=True)
-        selected_words = [word for score, word in words[:count]]
-        
-        print(f"Selected {len(selected_words)} words based on learning progress and frequency")
-        return selected_words
-
-    def update_word_progress(self, user_id: str, word: str, is_correct: bool, question_type: str):
-        """Update progress for a specific word"""
-        # Get or create word progress document
-        word_ref = (self.firebase.db.collection('users')
-                   .document(user_id)
-                   .collection('word_progress')
-                   .document(word))
+        # Base score from frequency
+        scores = 1000 - ranks / 10
         
-        word_doc = word_ref.get()
-        if word_doc.exists:
-            data = word_doc.to_dict()
+        # Priority based on accuracy - focus on words with low accuracy, giving extra
+        # weight to the type with lower accuracy
+        practiced_scores = np.maximum(1000 * (1 - meaning_accuracy), 1000 * (1 - reading_accuracy))
+        # Add bonus for words that need practice in both areas
+        practiced_scores += 500 * ((meaning_accuracy < 0.7) & (reading_accuracy < 0.7))
+        # Consider streaks - prioritize words where streaks were recently broken
+        practiced_scores += 300 * ((meaning_streak == 0) & (meaning_attempts > 0))
+        practiced_scores += 300 * ((reading_streak == 0) & (reading_attempts > 0))
+        
+        # Highest priority for new words
+        is_new = (meaning_attempts == 0) | (reading_attempts == 0)
+        scores += np.where(is_new, 2000, practiced_scores)
+        
+        # Increase priority for words not practiced in 3-7 days
+        days_since_practice = (current_time - last_seen) * (1 / SECONDS_PER_DAY)
+        scores += 500 * ((last_seen > 0) & (days_since_practice >= 3) & (days_since_practice <= 7))
+        
+        # Add some randomness to break ties and provide variety
+        scores += _rng.uniform(0, 100, n)
+        
+        # Take the top count words, highest score first
+        if n > count:
+            top = np.argpartition(-scores, count - 1)[:count]
         else:
-            # Get word details from frequency dictionary
-            word_details = None
-            try:
-                word_query = (self.firebase.db.collection('frequency_dictionary')
-                            .where('word', '==', word)
-                            .limit(1)
-                            .stream())
-                word_details = next(word_query).to_dict()
-            except StopIteration:
-                try:
-                    word_doc = self.firebase.db.collection('frequency_dictionary').document(word).get()
-                    if word_doc.exists:
-                        word_details = word_doc.to_dict()
-                except:
-                    pass
-            
-            # Initialize new word progress
-            data = {
-                'word': word,
-                'reading': word_details.get('reading', '') if word_details else '',
-                'meaning': word_details.get('meaning', '') if word_details else '',
-                'meaning_correct_streak': 0,
-                'reading_correct_streak': 0,
-                'total_meaning_attempts': 0,
-                'total_reading_attempts': 0,
-                'meaning_correct_count': 0,
-                'reading_correct_count': 0,
-                'first_seen': firestore.SERVER_TIMESTAMP,
-                'last_seen': firestore.SERVER_TIMESTAMP,
-                'mastered': False
-            }
+            top = np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        
+        selected_words = []
+        missing_audio = []
+        for i in top:
+            doc_ref, data, actual_word = candidates[i]
+            logger.debug("Word: %s, Score: %.2f (Meaning acc: %.2f, Reading acc: %.2f, Attempts: %d/%d)",
+                         actual_word, scores[i], meaning_accuracy[i], reading_accuracy[i],
+                         meaning_attempts[i], reading_attempts[i])
+            item = VocabularyItem(
+                word=actual_word,
+                reading=data.get('reading', ''),
+                meaning=data.get('meaning', ''),
+                audio_url=data.get('audio_url'),
+                frequency_rank=data.get('frequency_rank')
+            )
+            selected_words.append(item)
+            if not item.audio_url:
+                missing_audio.append((doc_ref, data, item))
+        
+        # Generate audio URLs that are not present in parallel, committing the updates once
+        audio_urls = self.generate_audio_many([item.word for _, _, item in missing_audio])
+        audio_batch = self.firebase.db.batch()
+        audio_updates = 0
+        for doc_ref, data, item in missing_audio:
+            audio_url = audio_urls.get(item.word)
+            if audio_url:
+                data['audio_url'] = item.audio_url = audio_url
+                # Update the frequency dictionary with the audio URL
+                audio_batch.update(doc_ref, {'audio_url': audio_url})
+                audio_updates += 1
+        if audio_updates:
+            audio_batch.commit()
+        
+        logger.info("Selected %d words based on learning progress and frequency", len(selected_words))
+        return selected_words
+
+    def _forget_recent_words(self, user_id: str):
+        """Drop the user's cached recent words, a word was just practiced"""
+        with self._recent_cache_lock:
+            for key in [key for key in self._recent_cache if key[0] == user_id]:
+                self._recent_cache.pop(key, None)
+
+    def _new_word_progress(self, word: str) -> Dict:
+        """Initial progress document for a word the user has not seen before"""
+        # Get word details from frequency dictionary
+        word_details = self._get_word_details(word)
         
+        return {
+            'word': word,
+            'reading': word_details.get('reading', '') if word_details else '',
+            'meaning': word_details.get('meaning', '') if word_details else '',
+            'meaning_correct_streak': 0,
+            'reading_correct_streak': 0,
+            'total_meaning_attempts': 0,
+            'total_reading_attempts': 0,
+            'meaning_correct_count': 0,
+            'reading_correct_count': 0,
+            'first_seen': firestore.SERVER_TIMESTAMP,
+            'last_seen': firestore.SERVER_TIMESTAMP,
+            'mastered': False
+        }
+
+    @staticmethod
+    def _apply_word_result(data: Dict, is_correct: bool, question_type: str) -> bool:
+        """Apply one answer to a word progress document, returns True if the word just became mastered"""
         # Update streaks and counts
         streak_field = f'{question_type}_correct_streak'
         attempts_field = f'total_{question_type}_attempts'
@@ -376,6 +757,23 @@ class JapaneseTutor:
             not data.get('mastered', False)):
             data['mastered'] = True
             data['mastered_date'] = firestore.SERVER_TIMESTAMP
+            return True
+        return False
+
+    def update_word_progress(self, user_id: str, word: str, is_correct: bool, question_type: str):
+        """Update progress for a specific word"""
+        # Get or create word progress document
+        word_ref = (self.firebase.db.collection('users')
+                   .document(user_id)
+                   .collection('word_progress')
+                   .document(word))
+        
+        self._forget_recent_words(user_id)
+        
+        word_doc = word_ref.get()
+        data = word_doc.to_dict() if word_doc.exists else self._new_word_progress(word)
+        
+        if self._apply_word_result(data, is_correct, question_type):
             # Also record in mastered_words collection
             self.record_word_mastery(user_id, word, 'practice')
         
@@ -384,32 +782,138 @@ class JapaneseTutor:
         
         return data
 
+    def update_word_progress_batch(self, user_id: str, results: List[tuple]) -> Dict[str, Dict]:
+        """Apply (word, is_correct, question_type) results in order with one read and batched writes"""
+        if not results:
+            return {}
+        self._forget_recent_words(user_id)
+        
+        # Current progress for every word in a single get_all
+        existing = self.firebase.get_user_docs_bulk(user_id, 'word_progress', [word for word, _, _ in results])
+        progress = {}
+        newly_mastered = set()
+        for word, is_correct, question_type in results:
+            data = progress.get(word)
+            if data is None:
+                data = progress[word] = existing.get(word) or self._new_word_progress(word)
+            if self._apply_word_result(data, is_correct, question_type):
+                newly_mastered.add(word)
+        
+        word_progress = (self.firebase.db.collection('users')
+                        .document(user_id)
+                        .collection('word_progress'))
+        batch = self.firebase.db.batch()
+        pending = 0
+        for word, data in progress.items():
+            batch.set(word_progress.document(word), data, merge=True)
+            pending += 1
+            # Also record in mastered_words collection
+            if word in newly_mastered and self.record_word_mastery(user_id, word, 'practice', batch=batch):
+                pending += 1
+            if pending >= MAX_BATCH_OPS - 1:
+                batch.commit()
+                batch = self.firebase.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+        
+        return progress
+
     def validate_exercise(self, exercise):
         """Validate that an exercise is properly formatted"""
         required_fields = ['type', 'question', 'correct', 'options']
         for field in required_fields:
             if field not in exercise:
-                print(f"Exercise missing required field: {field}")
+                logger.warning("Exercise missing required field: %s", field)
                 return False
                 
         if not isinstance(exercise['options'], list):
-            print("Exercise options must be a list")
+            logger.warning("Exercise options must be a list")
             return False
             
         if len(exercise['options']) != 4:
-            print(f"Exercise must have exactly 4 options, got {len(exercise['options'])}")
+            logger.warning("Exercise must have exactly 4 options, got %d", len(exercise['options']))
             return False
             
         if exercise['correct'] not in exercise['options']:
-            print("Exercise correct answer not in options")
+            logger.warning("Exercise correct answer not in options")
             return False
             
         return True
         
+    def _warm_audio_cache(self):
+        """Load the names of every uploaded audio blob once per process"""
+        cls = type(self)
+        with cls._audio_cache_lock:
+            if cls._audio_cache_warmed:
+                return
+            try:
+                blobs = self.firebase.storage.list_blobs(prefix='audio/', fields='items(name),nextPageToken')
+                cls._uploaded_audio.update(blob.name for blob in blobs)
+                cls._audio_cache_warmed = True
+                logger.info("Found %d uploaded audio files", len(cls._uploaded_audio))
+            except Exception as e:
+                logger.warning("Could not list uploaded audio: %s", e)
+
+    def _store_episode_audio(self, episode_ref, words: List[str]):
+        """Generate audio for a podcast episode's words and patch them into its vocabulary_audio map"""
+        try:
+            audio_urls = self.generate_audio_many(words)
+            # Patch only the new audio URLs into the episode's audio map, no list rewrite
+            if audio_urls:
+                episode_ref.update({
+                    firestore.FieldPath('vocabulary_audio', word).to_api_repr(): audio_url
+                    for word, audio_url in audio_urls.items()
+                })
+        except Exception as e:
+            logger.error("Error storing episode audio: %s", e)
+
+    def _existing_audio_url(self, text: str) -> Optional[str]:
+        """Public URL of text's audio if it has already been uploaded"""
+        # Blob names are derived from the text, so an existing blob already holds this audio
+        audio_path = _audio_path(text)
+        blob = self.firebase.storage.blob(audio_path)
+        if audio_path in self._uploaded_audio:
+            return blob.public_url
+        try:
+            if blob.exists():
+                self._uploaded_audio.add(audio_path)
+                return blob.public_url
+        except Exception as storage_error:
+            logger.error("Storage error details: %s", storage_error)
+        return None
+
+    def _upload_audio(self, text: str, audio_content: bytes) -> Optional[str]:
+        """Upload MP3 audio for text to Firebase Storage and return its public URL"""
+        audio_path = _audio_path(text)
+        blob = self.firebase.storage.blob(audio_path)
+        try:
+            # Same text always yields the same blob, so browsers and CDNs can keep it forever
+            blob.cache_control = AUDIO_CACHE_CONTROL
+            # Upload audio content
+            blob.upload_from_string(
+                audio_content,
+                content_type='audio/mpeg'
+            )
+            
+            # Make public and get URL
+            blob.make_public()
+            self._uploaded_audio.add(audio_path)
+            # Get the public URL directly from the blob
+            return blob.public_url
+            
+        except Exception as storage_error:
+            logger.error("Storage error details: %s", storage_error)
+            return None
+
     def generate_audio(self, text: str, language_code: str = "ja-JP") -> Optional[str]:
         """Generate audio for text and return a Firebase Storage URL"""
+        audio_url = self._existing_audio_url(text)
+        if audio_url:
+            return audio_url
+        
         if not self.tts_client:
-            print("Text-to-Speech client not initialized")
+            logger.warning("Text-to-Speech client not initialized")
             return None
             
         try:
@@ -418,14 +922,14 @@ class JapaneseTutor:
             # Configure voice
             voice = texttospeech.VoiceSelectionParams(
                 language_code=language_code,
-                name="ja-JP-Neural2-B",  # Using a neural voice for better quality
+                name=TTS_VOICE,  # Using a neural voice for better quality
                 ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
             )
             
             # Configure audio
             audio_config = texttospeech.AudioConfig(
                 audio_encoding=texttospeech.AudioEncoding.MP3,
-                speaking_rate=0.85  # Slightly slower for learning
+                speaking_rate=TTS_SPEAKING_RATE  # Slightly slower for learning
             )
             
             # Generate audio
@@ -435,126 +939,172 @@ class JapaneseTutor:
                 audio_config=audio_config
             )
             
-            try:
-                # Save to Firebase Storage
-                audio_path = f"audio/{base64.urlsafe_b64encode(text.encode()).decode()}.mp3"
-                blob = self.firebase.storage.blob(audio_path)
-                
-                # Upload audio content
-                blob.upload_from_string(
-                    response.audio_content,
-                    content_type='audio/mpeg'
-                )
-                
-                # Make public and get URL
-                blob.make_public()
-                # Get the public URL directly from the blob
-                return blob.public_url
-                
-            except Exception as storage_error:
-                print(f"Storage error details: {storage_error}")
-                return None
+            return self._upload_audio(text, response.audio_content)
             
         except Exception as e:
-            print(f"Error generating audio: {e}")
+            logger.error("Error generating audio: %s", e)
             return None
 
+    @staticmethod
+    def _ssml_word(i: int, text: str) -> str:
+        """SSML for one word of a batched request, marked so its clip can be cut out"""
+        return f'<mark name="w{i}"/>{xml_escape(text)}<break time="{TTS_BATCH_BREAK_MS}ms"/>'
+    
+    @classmethod
+    def _tts_batches(cls, texts: List[str]) -> List[List[str]]:
+        """Split texts into groups whose SSML fits in a single TTS request"""
+        batches, batch, size = [], [], len('<speak></speak>')
+        for text in texts:
+            word_size = len(cls._ssml_word(len(batch), text).encode('utf-8'))
+            if batch and size + word_size > TTS_BATCH_MAX_BYTES:
+                batches.append(batch)
+                batch, size = [], len('<speak></speak>')
+                word_size = len(cls._ssml_word(0, text).encode('utf-8'))
+            batch.append(text)
+            size += word_size
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _synthesize_many(self, texts: List[str], language_code: str = "ja-JP") -> Dict[str, bytes]:
+        """Synthesize several texts in one TTS request and split the MP3 at SSML marks"""
+        ssml = ['<speak>']
+        ssml.extend(self._ssml_word(i, text) for i, text in enumerate(texts))
+        ssml.append('</speak>')
+        
+        response = self.tts_beta_client.synthesize_speech(request={
+            'input': {'ssml': ''.join(ssml)},
+            'voice': {
+                'language_code': language_code,
+                'name': TTS_VOICE,
+                'ssml_gender': texttospeech_v1beta1.SsmlVoiceGender.FEMALE,
+            },
+            'audio_config': {
+                'audio_encoding': texttospeech_v1beta1.AudioEncoding.MP3,
+                'speaking_rate': TTS_SPEAKING_RATE,
+            },
+            'enable_time_pointing': [texttospeech_v1beta1.SynthesizeSpeechRequest.TimepointType.SSML_MARK],
+        })
+        
+        # Each word runs from its mark to the next one, the last to the end of the audio
+        starts = {point.mark_name: point.time_seconds * 1000 for point in response.timepoints}
+        audio = AudioSegment.from_file(io.BytesIO(response.audio_content), format='mp3')
+        clips = {}
+        for i, text in enumerate(texts):
+            start = starts.get(f'w{i}')
+            if start is None:
+                continue
+            clip = io.BytesIO()
+            audio[start:starts.get(f'w{i + 1}', len(audio))].export(clip, format='mp3')
+            clips[text] = clip.getvalue()
+        return clips
+    
+    def _synthesize_batch(self, texts: List[str]) -> Dict[str, bytes]:
+        """_synthesize_many for one batch, an empty result if the request fails"""
+        if len(texts) < 2:
+            return {}
+        try:
+            return self._synthesize_many(texts)
+        except Exception as e:
+            logger.error("Error generating batched audio: %s", e)
+            return {}
+
+    def generate_audio_many(self, texts: List[str]) -> Dict[str, str]:
+        """Generate audio for several texts, returns {text: url} for the ones that succeeded"""
+        texts = list(dict.fromkeys(texts))
+        if not texts:
+            return {}
+        urls = dict(zip(texts, self._audio_pool.map(self._existing_audio_url, texts)))
+        
+        # Synthesize everything missing in as few TTS requests as the size limit allows, concurrently
+        missing = [text for text in texts if not urls[text]]
+        if len(missing) > 1 and self.tts_beta_client:
+            try:
+                clips = {}
+                for batch_clips in self._audio_pool.map(self._synthesize_batch, self._tts_batches(missing)):
+                    clips.update(batch_clips)
+                urls.update(zip(clips, self._audio_pool.map(self._upload_audio, clips, clips.values())))
+            except Exception as e:
+                logger.error("Error generating batched audio: %s", e)
+        
+        # Anything the batch did not cover falls back to one request per text
+        missing = [text for text in texts if not urls[text]]
+        urls.update(zip(missing, self._audio_pool.map(self.generate_audio, missing)))
+        return {text: url for text, url in urls.items() if url}
+
     def create_lesson(self, user_id: str, lesson_number: int = 1) -> Dict:
         """Create a personalized lesson with frequency-based vocabulary"""
-        print("\nCreating new lesson...")
+        logger.info("Creating new lesson...")
         
         # Get next words to learn
         new_words = self.get_next_words_to_learn(user_id)
-        print(f"Got {len(new_words)} words to learn")
+        logger.debug("Got %d words to learn", len(new_words))
         
         # Generate audio for words that don't have it yet
-        word_audio_urls = {}  # Store audio URLs for each word
+        new_audio_urls = self.generate_audio_many(
+            [word.word for word in new_words if not getattr(word, 'audio_url', None)]
+        )
+        audio_batch = self.firebase.db.batch()
         for word in new_words:
-            if not hasattr(word, 'audio_url') or not word.audio_url:
-                audio_url = self.generate_audio(word.word)
-                if audio_url:
-                    word.audio_url = audio_url
-                    word_audio_urls[word.word] = audio_url
-                    # Save audio URL to frequency dictionary
-                    word_ref = self.firebase.db.collection('frequency_dictionary').document(word.word)
-                    word_ref.update({'audio_url': audio_url})
+            audio_url = new_audio_urls.get(word.word)
+            if audio_url:
+                word.audio_url = audio_url
+                # Save audio URL to frequency dictionary
+                word_ref = self.firebase.db.collection('frequency_dictionary').document(word.word)
+                audio_batch.update(word_ref, {'audio_url': audio_url})
+        if new_audio_urls:
+            audio_batch.commit()
+        # Store audio URLs for each word, including the ones that already had audio
+        word_audio_urls = {word.word: word.audio_url for word in new_words if getattr(word, 'audio_url', None)}
         
         if not new_words:
-            print("No suitable words found in frequency dictionary!")
+            logger.warning("No suitable words found in frequency dictionary!")
             return None
         
-        print("\nSelected words for this lesson:")
+        logger.debug("Selected words for this lesson:")
         for word in new_words:
-            print(f"- {word.word} ({word.reading}) - {word.meaning}")
-            print(f"  Audio URL: {getattr(word, 'audio_url', 'None')}")
+            logger.debug("- %s (%s) - %s, audio URL: %s",
+                         word.word, word.reading, word.meaning, getattr(word, 'audio_url', None))
         
         # Generate lesson content using AI
-        prompt = f"""
-        Create a Japanese lesson with multiple-choice questions using these words.
-        For each word, create both a meaning question and a reading question.
-        
-        Words to learn:
-        {', '.join([f"{w.word} ({w.reading}) - {w.meaning}" for w in new_words])}
+        prompt = _LESSON_PROMPT.format(
+            words=', '.join(f"{w.word} ({w.reading}) - {w.meaning}" for w in new_words)
+        )
         
-        Return a JSON object with this structure:
-        {{
-            "exercises": [
-                {{
-                    "type": "multiple_choice",
-                    "word": "<japanese_word>",
-                    "reading": "<reading>",
-                    "meaning": "<english_meaning>",
-                    "question": "<question in English>",
-                    "options": ["<option1>", "<option2>", "<option3>", "<option4>"],
-                    "correct": "<correct answer>"
-                }}
-            ]
-        }}
-        
-        For each word, create two types of questions:
-        1. Meaning question: "What does [japanese_word] mean?"
-        2. Reading question:
-           - If the word contains kanji: "How do you read [japanese_word]?" with hiragana options
-           - If the word is only hiragana: "How do you write [japanese_word] in romaji?" with romaji options
-        """
-        
-        print("\nCalling API to generate lesson content...")
-        lesson_content = self.call_api(prompt)
-        print(f"Got response of length: {len(lesson_content)}")
+        logger.debug("Calling API to generate lesson content...")
+        lesson_content = self.call_api(prompt, json_mode=True, cache=False)
+        logger.debug("Got response of length: %d", len(lesson_content))
         
         try:
             json_start = lesson_content.find('{')
-            json_end = lesson_content.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                lesson_json = lesson_content[json_start:json_end]
-                lesson_data = json.loads(lesson_json)
+            if json_start >= 0:
+                # Parse the object in place, trailing text after it is ignored
+                lesson_data, _ = _JSON_DECODER.raw_decode(lesson_content, json_start)
                 
                 # Add audio URLs to exercises
                 for exercise in lesson_data.get('exercises', []):
-                    word = exercise.get('word')
-                    if word in word_audio_urls:
-                        exercise['audio_url'] = word_audio_urls[word]
+                    audio_url = word_audio_urls.get(exercise.get('word'))
+                    if audio_url:
+                        exercise['audio_url'] = audio_url
                 
                 # Validate each exercise
-                print("\nValidating exercises...")
+                logger.debug("Validating exercises...")
                 for i, exercise in enumerate(lesson_data.get('exercises', [])):
-                    print(f"\nExercise {i+1}:")
-                    print(f"Question: {exercise['question']}")
-                    print(f"Options: {exercise['options']}")
-                    print(f"Correct: {exercise['correct']}")
-                    print(f"Audio URL: {exercise.get('audio_url', 'None')}")
+                    logger.debug("Exercise %d: question=%r options=%r correct=%r audio_url=%s",
+                                 i + 1, exercise['question'], exercise['options'],
+                                 exercise['correct'], exercise.get('audio_url'))
                     if exercise['correct'] not in exercise['options']:
-                        print(f"Warning: Correct answer not in options, fixing...")
+                        logger.warning("Correct answer not in options, fixing...")
                         exercise['options'][-1] = exercise['correct']
+                    exercise['question_type'] = exercise_question_type(exercise['question'])
                 
+                self.cache_response(prompt, lesson_content, json_mode=True)
                 return lesson_data
             else:
-                print("Error: No JSON found in API response")
-                print(f"Raw content: {lesson_content}")
+                logger.error("No JSON found in API response, raw content: %s", lesson_content)
                 raise ValueError("No JSON found in response")
         except Exception as e:
-            print(f"\nError parsing lesson content: {str(e)}")
-            print(f"Raw content: {lesson_content}")
+            logger.error("Error parsing lesson content: %s, raw content: %s", e, lesson_content)
             raise
 
     def get_user_seen_words(self, user_id: str) -> set:
@@ -562,9 +1112,30 @@ class JapaneseTutor:
         progress_docs = (self.firebase.db.collection('users')
                         .document(user_id)
                         .collection('word_progress')
+                        .select([])
                         .stream())
         return {doc.id for doc in progress_docs}
 
+    def _get_recent_word_ids(self, user_id: str, hours: int = 24) -> frozenset:
+        """Get words the user has practiced in the last hours (cached, see RECENT_WORDS_CACHE_TTL)"""
+        key = (user_id, hours)
+        with self._recent_cache_lock:
+            cached = self._recent_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        recent_progress = (self.firebase.db.collection('users')
+                         .document(user_id)
+                         .collection('word_progress')
+                         .where('last_seen', '>=', 
+                               datetime.now(timezone.utc) - timedelta(hours=hours))
+                         .select([])
+                         .stream())
+        recent = frozenset(doc.id for doc in recent_progress)
+        with self._recent_cache_lock:
+            self._recent_cache[key] = recent
+        return recent
+
     def validate_and_fix_exercises(self, lesson_data: Dict) -> Dict:
         """Validate exercises and fix any issues with options/answers"""
         if 'exercises' not in lesson_data:
@@ -575,27 +1146,25 @@ class JapaneseTutor:
             # Ensure we have all required fields
             required_fields = ['type', 'word', 'question', 'options', 'correct']
             if not all(field in exercise for field in required_fields):
-                print(f"Exercise missing required fields: {exercise}")
+                logger.warning("Exercise missing required fields: %s", exercise)
                 continue
                 
             # Ensure we have exactly 4 options
-            while len(exercise['options']) < 4:
+            if len(exercise['options']) < 4:
                 if exercise['question'].lower().startswith('how do you pronounce'):
                     # Add dummy romaji options
-                    dummy_options = ['ka', 'ki', 'ku', 'ke', 'ko', 'sa', 'shi', 'su', 'se', 'so']
-                    for opt in dummy_options:
-                        if opt not in exercise['options'] and opt != exercise['correct']:
-                            exercise['options'].append(opt)
-                            if len(exercise['options']) == 4:
-                                break
+                    dummy_options = self._DUMMY_ROMAJI
                 else:
                     # Add dummy meaning options
-                    dummy_options = ['thing', 'place', 'action', 'time', 'person', 'object', 'idea', 'feeling']
-                    for opt in dummy_options:
-                        if opt not in exercise['options'] and opt != exercise['correct']:
-                            exercise['options'].append(opt)
-                            if len(exercise['options']) == 4:
-                                break
+                    dummy_options = self._DUMMY_MEANINGS
+                present = set(exercise['options'])
+                present.add(exercise['correct'])
+                for opt in dummy_options:
+                    if opt not in present:
+                        present.add(opt)
+                        exercise['options'].append(opt)
+                        if len(exercise['options']) == 4:
+                            break
             
             # Trim if we somehow got more than 4 options
             exercise['options'] = exercise['options'][:4]
@@ -608,213 +1177,157 @@ class JapaneseTutor:
             # Shuffle options to avoid correct answer always being last
             random.shuffle(exercise['options'])
             
+            exercise['question_type'] = exercise_question_type(exercise['question'])
             fixed_exercises.append(exercise)
         
         lesson_data['exercises'] = fixed_exercises
         return lesson_data
 
+    @staticmethod
+    def _parse_lesson_json(content: str) -> Dict:
+        """Parse a JSON lesson, cleaning up the response only if it isn't valid JSON as is"""
+        try:
+            # JSON mode returns a bare object; strict=False allows raw newlines in strings
+            return json.loads(content, strict=False)
+        except json.JSONDecodeError:
+            pass
+        json_start = content.find('{')
+        json_end = content.rfind('}') + 1
+        if json_start < 0 or json_end <= json_start:
+            raise ValueError("No JSON found in response")
+        return json.loads(_WS_RE.sub(' ', _PAREN_RE.sub('', content[json_start:json_end])))
+
+    @staticmethod
+    def episode_vocabulary(episode_data: Dict) -> List[Dict]:
+        """Vocabulary items of a podcast episode, with audio URLs generated after processing filled in"""
+        vocab_items = episode_data.get('vocabulary_items', [])
+        audio_urls = episode_data.get('vocabulary_audio')
+        if audio_urls:
+            for item in vocab_items:
+                if not item.get('audio_url') and item.get('word') in audio_urls:
+                    item['audio_url'] = audio_urls[item['word']]
+        return vocab_items
+
+    @staticmethod
+    def select_target_vocab(vocab_items: List[Dict], mastered_words, seen_words, recently_used,
+                            k: int = PODCAST_LESSON_WORDS) -> List[Dict]:
+        """Pick the k unmastered episode words the user should practice next, best first"""
+        # Score vocabulary items
+        def score_word(word: str) -> float:
+            score = 0
+            # Prioritize unseen words
+            if word not in seen_words:
+                score += 100
+            # Deprioritize recently used words
+            if word in recently_used:
+                score -= 50
+            # Add some randomness to avoid same order
+            return score + random.uniform(0, 10)
+        
+        scored_vocab = (
+            (score_word(word_data['word']), word_data)
+            for word_data in vocab_items
+            if word_data['word'] not in mastered_words  # Skip mastered words
+        )
+        
+        # Take the top k by score (highest first) without sorting the rest. Every
+        # unmastered word is a candidate, so fewer than k means the episode has no more
+        return [word_data for _, word_data in heapq.nlargest(k, scored_vocab, key=lambda x: x[0])]
+
     def create_podcast_lesson(self, user_id: str, episode_number: int) -> Dict:
         """Create a lesson based on a podcast episode"""
         # Get episode transcript and vocabulary
         episode_ref = (self.firebase.db.collection('podcast_lessons')
                       .document(str(episode_number)))
-        episode_doc = episode_ref.get()
         
+        # Issue the episode read and the user's word lookups in parallel
+        episode_future = self._read_pool.submit(episode_ref.get)
+        mastered_future = self._read_pool.submit(self.get_user_mastered_words, user_id)
+        seen_future = self._read_pool.submit(self.get_user_seen_words, user_id)
+        recent_future = self._read_pool.submit(self._get_recent_word_ids, user_id)
+        
+        episode_doc = episode_future.result()
         if not episode_doc.exists:
             raise ValueError(f"Episode {episode_number} not found")
             
         episode_data = episode_doc.to_dict()
         transcript = episode_data.get('transcript', '')
         
-        # Get user's mastered and seen words
-        mastered_words = self.get_user_mastered_words(user_id)
-        seen_words = self.get_user_seen_words(user_id)
-        
-        # Get recently used words (from the last 24 hours)
-        current_time = datetime.now().timestamp()
-        recent_progress = (self.firebase.db.collection('users')
-                         .document(user_id)
-                         .collection('word_progress')
-                         .where('last_seen', '>=', 
-                               datetime.now().timestamp() - (24 * 60 * 60))
-                         .stream())
-        recently_used = {doc.id for doc in recent_progress}
+        # Get user's mastered and seen words, and recently used words (from the last 24 hours)
+        mastered_words = mastered_future.result()
+        seen_words = seen_future.result()
+        recently_used = recent_future.result()
         
         # Get all available vocabulary items from the episode
-        vocab_items = episode_data.get('vocabulary_items', [])
+        vocab_items = self.episode_vocabulary(episode_data)
         
-        # Score and sort vocabulary items
-        scored_vocab = []
-        for word_data in vocab_items:
-            word = word_data['word']
-            if word not in mastered_words:  # Skip mastered words
-                score = 0
-                # Prioritize unseen words
-                if word not in seen_words:
-                    score += 100
-                # Deprioritize recently used words
-                if word in recently_used:
-                    score -= 50
-                # Add some randomness to avoid same order
-                score += random.uniform(0, 10)
-                
-                scored_vocab.append((score, word_data))
-        
-        # Sort by score (highest first) and take top 5
-        scored_vocab.sort(reverse=True)
-        vocab = [word_data for _, word_data in scored_vocab[:5]]
-        
-        # If we don't have enough words, add some seen but unmastered words
-        if len(vocab) < 5:
-            remaining_needed = 5 - len(vocab)
-            seen_words_vocab = [
-                word_data for word_data in vocab_items
-                if word_data['word'] in seen_words 
-                and word_data['word'] not in mastered_words
-                and word_data not in vocab  # Avoid duplicates
-                and word_data['word'] not in recently_used  # Avoid recently used
-            ]
-            # Add randomness to selection of remaining words
-            random.shuffle(seen_words_vocab)
-            vocab.extend(seen_words_vocab[:remaining_needed])
-        
-        # Generate audio for words that don't have it
-        word_audio_urls = {}  # Store audio URLs for each word
-        updated_vocab = []  # Track any vocabulary updates
-        
-        for word_data in vocab:
-            word = word_data['word']
-            if not word_data.get('audio_url'):
-                audio_url = self.generate_audio(word)
-                if audio_url:
-                    word_data['audio_url'] = audio_url
-                    word_audio_urls[word] = audio_url
-                    updated_vocab.append(word_data)
-            else:
-                word_audio_urls[word] = word_data['audio_url']
-        
-        # If we generated any new audio URLs, update the vocabulary items in Firebase
-        if updated_vocab:
-            # Get current vocabulary items
-            current_vocab = episode_data.get('vocabulary_items', [])
-            # Update items with new audio URLs
-            vocab_dict = {item['word']: item for item in current_vocab}
-            for updated_item in updated_vocab:
-                vocab_dict[updated_item['word']] = updated_item
-            # Save back to Firebase
-            episode_ref.set({
-                'vocabulary_items': list(vocab_dict.values())
-            }, merge=True)
-        
-        # Generate lesson using AI
-        prompt = f"""
-        Create a Japanese lesson based on these vocabulary items from a podcast.
-        For each word, create both a meaning question and a reading question.
+        vocab = self.select_target_vocab(vocab_items, mastered_words, seen_words, recently_used)
         
-        Words to learn:
-        {', '.join([f"{w['word']} ({w['reading']}) - {w['meaning']}" for w in vocab])}
+        # Missing audio is generated in the background while the lesson is built, those words
+        # get no audio_url until a later load picks the upload up from vocabulary_audio
+        word_audio_urls = {w['word']: w['audio_url'] for w in vocab if w.get('audio_url')}
+        missing = [word_data['word'] for word_data in vocab if not word_data.get('audio_url')]
+        if missing:
+            self._background_pool.submit(self._store_episode_audio, episode_ref, missing)
         
-        Return a JSON object with this structure:
-        {{
-            "vocabulary": [
-                {{
-                    "word": "<japanese>",
-                    "reading": "<hiragana>",
-                    "romaji": "<romaji>",
-                    "meaning": "<english>",
-                    "context": "<japanese sentence from transcript>",
-                    "context_en": "<english translation>",
-                    "explanation": "<usage explanation>"
-                }}
-            ],
-            "exercises": [
-                {{
-                    "type": "multiple_choice",
-                    "word": "<japanese_word>",
-                    "reading": "<hiragana>",
-                    "romaji": "<romaji>",
-                    "meaning": "<english_meaning>",
-                    "question": "<question in English>",
-                    "options": ["<option1>", "<option2>", "<option3>", "<option4>"],
-                    "correct": "<correct answer>",
-                    "context": "<example sentence>",
-                    "context_en": "<english translation>"
-                }}
-            ]
-        }}
+        # The generated lesson depends only on the chosen words, so it is stored per word list
+        # on the episode and shared by every user and server that picks the same words
+        vocab.sort(key=lambda w: w['word'])
+        words = ', '.join(f"{w['word']} ({w['reading']}) - {w['meaning']}" for w in vocab)
+        generated_ref = (episode_ref.collection('generated_lessons')
+                        .document(hashlib.sha1(words.encode()).hexdigest()))
+        generated_doc = generated_ref.get()
+        if generated_doc.exists:
+            lesson_data = generated_doc.to_dict()['lesson']
+        else:
+            lesson_data = self._generate_podcast_lesson(words)
+            generated_ref.set({'lesson': lesson_data, 'created': firestore.SERVER_TIMESTAMP})
         
-        For each word, create two types of questions:
-        1. Meaning question: "What does [japanese_word] mean?"
-        2. Reading question: "How do you pronounce [japanese_word]?"
-           - Always use romaji for pronunciation answers
-           - Include both hiragana and romaji in the question data
+        # Add audio URLs to exercises and vocabulary in one pass
+        for item in chain(lesson_data.get('exercises', []), lesson_data.get('vocabulary', [])):
+            audio_url = word_audio_urls.get(item.get('word'))
+            if audio_url:
+                item['audio_url'] = audio_url
         
-        IMPORTANT RULES:
-        1. Each question MUST have exactly 4 options
-        2. The correct answer MUST be included in the options
-        3. For meaning questions, use English words as options
-        4. For reading questions, use ONLY romaji options
-        5. Always include the Japanese word in the question
-        6. Include relevant example sentences from the transcript when possible
-        7. Provide clear, natural English translations
-        """
+        # Add episode info
+        lesson_data['episode_number'] = episode_number
+        lesson_data['transcript'] = transcript
         
-        lesson_content = self.call_api(prompt)
+        return lesson_data
+
+    def _generate_podcast_lesson(self, words: str) -> Dict:
+        """Generate and validate podcast lesson content for a formatted word list using AI"""
+        prompt = _PODCAST_LESSON_PROMPT.format(words=words)
+        lesson_content = self.call_api(prompt, json_mode=True, cache=False)
         try:
-            json_start = lesson_content.find('{')
-            json_end = lesson_content.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                lesson_json = lesson_content[json_start:json_end]
-                lesson_json = re.sub(r'\([^)]*\)', '', lesson_json)
-                lesson_json = re.sub(r'\s+', ' ', lesson_json)
-                lesson_data = json.loads(lesson_json)
-                
-                # Validate and fix exercises
-                lesson_data = self.validate_and_fix_exercises(lesson_data)
-                
-                # Add audio URLs to exercises and vocabulary
-                for exercise in lesson_data.get('exercises', []):
-                    word = exercise.get('word')
-                    if word in word_audio_urls:
-                        exercise['audio_url'] = word_audio_urls[word]
-                
-                for vocab_item in lesson_data.get('vocabulary', []):
-                    word = vocab_item.get('word')
-                    if word in word_audio_urls:
-                        vocab_item['audio_url'] = word_audio_urls[word]
-                
-                # Add episode info
-                lesson_data['episode_number'] = episode_number
-                lesson_data['transcript'] = transcript
-                
-                return lesson_data
-            else:
-                raise ValueError("No JSON found in response")
+            lesson_data = self._parse_lesson_json(lesson_content)
+            
+            # Validate and fix exercises
+            lesson_data = self.validate_and_fix_exercises(lesson_data)
+            self.cache_response(prompt, lesson_content, json_mode=True)
+            return lesson_data
         except Exception as e:
-            print(f"Error parsing lesson content: {e}")
-            print(f"Raw content: {lesson_content}")
+            logger.error("Error parsing lesson content: %s, raw content: %s", e, lesson_content)
             raise
 
-    def save_lesson_progress(self, user_id: str, lesson_data: Dict, lesson_type: str = 'regular'):
+    def save_lesson_progress(self, user_id: str, lesson_data: Dict):
         """Save user's lesson progress and update word mastery"""
-        # Save lesson completion
-        collection_name = 'lesson_progress' if lesson_type == 'regular' else 'podcast_progress'
-        lesson_number = lesson_data.get('lesson_number', lesson_data.get('episode_number'))
-        
-        progress_ref = (self.firebase.db.collection('users')
-                       .document(user_id)
-                       .collection(collection_name)
-                       .document(str(lesson_number)))
-        
-        progress_ref.set({
-            'completed': True,
-            'score': lesson_data.get('score', 100),
-            'timestamp': firestore.SERVER_TIMESTAMP
-        }, merge=True)
-        
-        # Update word mastery for completed words
+        # Save lesson completion, lesson_data['lesson_type'] picks the progress collection
+        self.firebase.save_lesson_progress(user_id, lesson_data)
+        
+        # Update word mastery for completed words in as few commits as possible
+        lesson_type = lesson_data.get('lesson_type', 'regular')
+        batch = self.firebase.db.batch()
+        pending = 0
         for word in lesson_data.get('completed_words', []):
-            self.record_word_mastery(user_id, word, lesson_type)
+            if self.record_word_mastery(user_id, word, lesson_type, batch=batch):
+                pending += 1
+            if pending == MAX_BATCH_OPS:
+                batch.commit()
+                batch = self.firebase.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
 
 # Example usage:
 if __name__ == "__main__":
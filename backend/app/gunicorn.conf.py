@@ -0,0 +1,17 @@
+import os
+
+# Production server: gunicorn managing uvicorn workers, run from backend/app with
+#   gunicorn main:app
+bind = os.getenv('BIND', '0.0.0.0:8000')
+# One worker by default: each worker loads its own Whisper model that uses every core,
+# and keeps its own lesson and progress caches that another worker's progress save can't
+# invalidate. Requests already run concurrently on the worker's threadpool (THREADPOOL_SIZE).
+# Podcast jobs are tracked in Firestore, so with WEB_CONCURRENCY=2 only those caches can lag
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Lesson generation waits on OpenAI for a long time
+timeout = 120
+keepalive = 5
+# Keep request-path logging quiet in production unless overridden
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+loglevel = os.environ['LOG_LEVEL'].lower()
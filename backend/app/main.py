@@ -1,23 +1,57 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from grok_enhanced_tutor import JapaneseTutor
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from grok_enhanced_tutor import JapaneseTutor, exercise_question_type
 from firebase_config import FirebaseManager
+from firebase_admin import firestore
 from podcast_processor import PodcastProcessor
 from dotenv import load_dotenv
 import os
-from typing import Optional
-from pydantic import BaseModel
-import traceback
+from typing import Callable, Dict, Iterator, List, Literal, Optional
+from pydantic import BaseModel, ConfigDict
+from cachetools import TTLCache
+from threading import Lock
+from concurrent.futures import Future, ThreadPoolExecutor
+import anyio.to_thread
+import asyncio
+import hashlib
+import uuid
+from functools import lru_cache
 import logging
+import orjson
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging, LOG_LEVEL=DEBUG shows per-word scoring and API attempts
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+class ORJSONRequest(Request):
+    """Request whose JSON body is decoded with orjson"""
+    async def json(self):
+        if not hasattr(self, "_json"):
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so FastAPI still returns 422
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+class ORJSONRoute(APIRoute):
+    """Route that parses request bodies through ORJSONRequest"""
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def orjson_route_handler(request: Request):
+            return await handler(ORJSONRequest(request.scope, request.receive))
+
+        return orjson_route_handler
+
+# Lesson payloads are large nested dicts of Japanese text, encode them with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
+app.router.route_class = ORJSONRoute
 
 # Configure CORS
 app.add_middleware(
@@ -28,121 +62,382 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-firebase = FirebaseManager()
-tutor = JapaneseTutor(
-    api_key=os.getenv('OPENAI_API_KEY'),
-    firebase_manager=firebase,
-    api_provider="openai"
-)
-podcast_processor = PodcastProcessor(os.getenv('OPENAI_API_KEY'))
+# Lesson JSON is highly repetitive, gzip anything bigger than a status message
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+class LazyFirebase:
+    """Proxy for a FirebaseManager that is being initialized in the background
+
+    Only ready() is its own, every other attribute (db, flush(), drain(), ...) is looked up
+    on the FirebaseManager once it exists.
+    """
+    def __init__(self, future: Future):
+        self._future = future
+    
+    def ready(self) -> bool:
+        return self._future.done() and self._future.exception() is None
+    
+    def __getattr__(self, name):
+        # Blocks only if a request arrives before initialization has finished
+        return getattr(self._future.result(), name)
+
+def _log_firebase_init(future: Future):
+    if future.exception():
+        logger.error("Firebase initialization failed: %s", future.exception())
+
+# Services are built once per process on first use, endpoints get them through Depends
+@lru_cache()
+def get_firebase() -> LazyFirebase:
+    """Shared FirebaseManager proxy, its credentials load in the background from the first call"""
+    future = ThreadPoolExecutor(max_workers=1).submit(FirebaseManager)
+    future.add_done_callback(_log_firebase_init)
+    return LazyFirebase(future)
+
+@lru_cache()
+def get_tutor() -> JapaneseTutor:
+    """Shared JapaneseTutor"""
+    return JapaneseTutor(
+        api_key=os.getenv('OPENAI_API_KEY'),
+        firebase_manager=get_firebase(),
+        api_provider="openai"
+    )
+
+@lru_cache()
+def get_podcast_processor() -> PodcastProcessor:
+    """Shared PodcastProcessor, loading its Whisper model is deferred to the first podcast job"""
+    return PodcastProcessor(os.getenv('OPENAI_API_KEY'), firebase_manager=get_firebase(), tutor=get_tutor())
+
+@app.middleware("http")
+async def flush_firestore_writes(request: Request, call_next):
+    """Commit any Firestore writes batched while handling the request"""
+    try:
+        return await call_next(request)
+    finally:
+        # Commits run on FirebaseManager's writer pool, so this doesn't block
+        firebase = get_firebase()
+        if firebase.ready():
+            firebase.flush()
+
+# Threads available to run_in_threadpool, lesson generation holds one for a long time
+THREADPOOL_SIZE = int(os.getenv('THREADPOOL_SIZE', 64))
+
+@app.on_event("startup")
+async def size_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+@app.on_event("startup")
+def start_services():
+    # Build the shared services before the first request so concurrent requests never race
+    # to construct them; Firebase finishes initializing in the background
+    get_tutor()
+
+@app.on_event("shutdown")
+def flush_on_shutdown():
+    firebase = get_firebase()
+    if firebase.ready():
+        firebase.drain()
+    # The podcast processor shares this tutor
+    get_tutor().close()
+    _podcast_executor.shutdown(wait=False)
+
+# Generated lessons are reused for a few minutes per (lesson type, user, lesson)
+LESSON_CACHE_TTL = 300
+_lesson_cache = TTLCache(maxsize=1024, ttl=LESSON_CACHE_TTL)
+_lesson_cache_lock = Lock()
+
+_inflight_lessons: Dict[tuple, Future] = {}
+
+def get_cached_lesson(key: tuple, build: Callable, *args):
+    """Return the cached lesson for key, building it with build(*args) on a miss"""
+    with _lesson_cache_lock:
+        if key in _lesson_cache:
+            return _lesson_cache[key]
+        future = _inflight_lessons.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight_lessons[key] = Future()
+    
+    if not owner:
+        # Another request is already generating this lesson, share its result
+        return future.result()
+    
+    try:
+        lesson = build(*args)
+    except Exception as e:
+        with _lesson_cache_lock:
+            _inflight_lessons.pop(key, None)
+        future.set_exception(e)
+        raise
+    
+    with _lesson_cache_lock:
+        if lesson is not None:
+            _lesson_cache[key] = lesson
+        _inflight_lessons.pop(key, None)
+    future.set_result(lesson)
+    return lesson
+
+def forget_user_lessons(user_id: str):
+    """Drop every cached lesson for a user, so the next request builds one from their new progress"""
+    with _lesson_cache_lock:
+        for key in [key for key in _lesson_cache.keys() if key[1] == user_id]:
+            _lesson_cache.pop(key, None)
+
+def conditional_json_response(request: Request, payload) -> Response:
+    """JSON response with an ETag, answering 304 when the client already has it"""
+    body = orjson.dumps(jsonable_encoder(payload))
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    # no-cache: the browser may keep the body but must revalidate the ETag on every use
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+# The /podcasts episode list and each user's progress sets are reused for a short window
+PODCASTS_CACHE_TTL = 30
+_podcasts_cache = TTLCache(maxsize=1024, ttl=PODCASTS_CACHE_TTL)
+_podcasts_cache_lock = Lock()
+
+def get_cached_podcast_data(key: tuple, load: Callable, *args):
+    """Return the cached /podcasts data for key, loading it with load(*args) on a miss"""
+    with _podcasts_cache_lock:
+        if key in _podcasts_cache:
+            return _podcasts_cache[key]
+    value = load(*args)
+    with _podcasts_cache_lock:
+        _podcasts_cache[key] = value
+    return value
+
+# Episode fields returned by /podcasts, leaving out the transcript and generated lessons
+PODCAST_LISTING_FIELDS = [
+    'name', 'description', 'show_name', 'show_publisher', 'release_date',
+    'image_url', 'processed_date', 'vocabulary_items', 'vocabulary_words',
+]
+
+def _load_podcasts() -> List[tuple]:
+    """Every processed podcast as (data, set of its vocabulary words)"""
+    podcasts = []
+    for doc in get_firebase().db.collection('podcast_lessons').select(PODCAST_LISTING_FIELDS).stream():
+        data = doc.to_dict()
+        if data:
+            data['id'] = doc.id
+            # Episodes processed since vocabulary_words was added carry the word list precomputed
+            vocab_words = frozenset(data.pop('vocabulary_words', None)
+                                    or (item['word'] for item in data.get('vocabulary_items', [])))
+            podcasts.append((data, vocab_words))
+    return podcasts
+
+def _load_user_progress(user_id: str) -> tuple:
+    """The user's (encountered, mastered) word sets"""
+    encountered_words = set()
+    mastered_words = set()
+    word_progress_docs = (get_firebase().db.collection('users').document(user_id)
+                          .collection('word_progress')
+                          .select(['meaning_correct_streak'])
+                          .stream())
+    for doc in word_progress_docs:
+        encountered_words.add(doc.id)
+        # A word is mastered if it has been correctly answered 5 times in a row. Checked here
+        # rather than with a where() query, which would read every mastered doc a second time
+        if doc.to_dict().get('meaning_correct_streak', 0) >= 5:
+            mastered_words.add(doc.id)
+    return encountered_words, mastered_words
+
+# Podcast lessons embed the whole transcript, stream them once they get this long
+STREAM_TRANSCRIPT_CHARS = 20000
+
+def iter_json_object(payload: Dict) -> Iterator[bytes]:
+    """Encode a dict as JSON piece by piece, one list item at a time"""
+    yield b'{'
+    for i, (key, value) in enumerate(payload.items()):
+        yield (b',' if i else b'') + orjson.dumps(key) + b':'
+        if isinstance(value, list):
+            yield b'['
+            for j, item in enumerate(value):
+                yield (b',' if j else b'') + orjson.dumps(item)
+            yield b']'
+        else:
+            yield orjson.dumps(value)
+    yield b'}'
 
 # Request models
 class SpotifyPodcastRequest(BaseModel):
     user_id: str = "default_user"
     spotify_url: str
 
+class ProgressExercise(BaseModel):
+    model_config = ConfigDict(extra='allow')
+    
+    word: Optional[str] = None
+    is_correct: Optional[bool] = None
+    question: str = ''
+    # Used to build word progress field names, so only the two known tracks are accepted
+    question_type: Optional[Literal['meaning', 'reading']] = None
+
+class ProgressData(BaseModel):
+    model_config = ConfigDict(extra='allow')
+    
+    exercises: List[ProgressExercise] = []
+
 class ProgressRequest(BaseModel):
     user_id: str = "default_user"
     lesson_type: str = "regular"
-    data: dict
+    data: ProgressData
 
 @app.get("/lesson")
-async def get_lesson(user_id: str = "default_user", lesson_number: int = 1):
-    lesson = tutor.create_lesson(user_id, lesson_number)
-    return lesson
+async def get_lesson(request: Request, user_id: str = "default_user", lesson_number: int = 1,
+                     tutor: JapaneseTutor = Depends(get_tutor)):
+    # Lesson generation blocks on OpenAI/Firestore, keep it off the event loop
+    lesson = await run_in_threadpool(
+        get_cached_lesson, ('regular', user_id, lesson_number),
+        tutor.create_lesson, user_id, lesson_number
+    )
+    return conditional_json_response(request, lesson)
 
 @app.get("/podcast-lesson")
-async def get_podcast_lesson(user_id: str = "default_user", episode_id: str = None):
+async def get_podcast_lesson(request: Request, user_id: str = "default_user", episode_id: str = None,
+                             tutor: JapaneseTutor = Depends(get_tutor)):
     if not episode_id:
         raise HTTPException(status_code=400, detail="Missing episode_id parameter")
-    lesson = tutor.create_podcast_lesson(user_id, episode_id)
-    return lesson
+    lesson = await run_in_threadpool(
+        get_cached_lesson, ('podcast', user_id, episode_id),
+        tutor.create_podcast_lesson, user_id, episode_id
+    )
+    if len(lesson.get('transcript', '')) > STREAM_TRANSCRIPT_CHARS:
+        # Chunked transfer instead of building the whole body (and its ETag) in memory
+        return StreamingResponse(iter_json_object(jsonable_encoder(lesson)), media_type='application/json')
+    return conditional_json_response(request, lesson)
+
+# Podcast processing (download + Whisper + vocabulary extraction) takes minutes, so it
+# runs as a background job. One worker at a time since the Whisper model is shared.
+_podcast_executor = ThreadPoolExecutor(max_workers=1)
+
+# Job state lives in Firestore so any server process can answer the status polls
+PODCAST_JOB_FIELDS = ('status', 'episode_id', 'error')
+
+def _podcast_job_ref(job_id: str):
+    """Firestore document holding a podcast job's state"""
+    return get_firebase().db.collection('podcast_jobs').document(job_id)
+
+def _set_podcast_job(job_id: str, update: Dict):
+    """Merge update into the job's document, written directly so polls see it at once"""
+    _podcast_job_ref(job_id).set({**update, 'updated': firestore.SERVER_TIMESTAMP}, merge=True)
+
+def _get_podcast_job(job_id: str) -> Optional[Dict]:
+    """Public fields of a podcast job, None if there is no such job"""
+    job_doc = _podcast_job_ref(job_id).get(field_paths=PODCAST_JOB_FIELDS)
+    return job_doc.to_dict() if job_doc.exists else None
+
+def _run_podcast_job(job_id: str, spotify_url: str):
+    """Process a podcast episode and record the outcome on the job"""
+    try:
+        _set_podcast_job(job_id, {'status': 'running'})
+        result = get_podcast_processor().process_spotify_episode(spotify_url)
+        update = {'status': 'finished', 'episode_id': result['episode_id']}
+        with _podcasts_cache_lock:
+            _podcasts_cache.pop(('podcasts',), None)
+    except Exception as e:
+        logger.exception("Error processing podcast: %s", e)
+        update = {'status': 'failed', 'error': str(e)}
+    try:
+        _set_podcast_job(job_id, update)
+    except Exception as e:
+        logger.exception("Error recording podcast job %s: %s", job_id, e)
 
-@app.post("/process-spotify-podcast")
+@app.post("/process-spotify-podcast", status_code=202)
 async def process_spotify_podcast(request: SpotifyPodcastRequest):
     if not request.spotify_url:
         raise HTTPException(status_code=400, detail="Missing spotify_url parameter")
     
-    try:
-        # Only process the podcast, don't create a lesson yet
-        result = podcast_processor.process_spotify_episode(request.spotify_url)
-        
-        return {
-            "status": "success",
-            "episode_id": result['episode_id']
-        }
-    except Exception as e:
-        logger.error(f"Error processing podcast: {str(e)}")
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=str(e))
+    # Only process the podcast, don't create a lesson yet
+    job_id = uuid.uuid4().hex
+    await run_in_threadpool(_set_podcast_job, job_id, {
+        'status': 'queued', 'spotify_url': request.spotify_url, 'created': firestore.SERVER_TIMESTAMP
+    })
+    _podcast_executor.submit(_run_podcast_job, job_id, request.spotify_url)
+    
+    return {
+        "status": "queued",
+        "job_id": job_id
+    }
+
+@app.get("/process-spotify-podcast/{job_id}")
+async def get_podcast_job(job_id: str):
+    """Get the status of a podcast processing job"""
+    # Firestore reads block, keep them off the event loop
+    job = await run_in_threadpool(_get_podcast_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    return {"job_id": job_id, **job}
+
+def _save_progress(tutor: JapaneseTutor, request: ProgressRequest):
+    """Record a finished lesson and its per-word results"""
+    # Save overall lesson progress
+    tutor.save_lesson_progress(request.user_id, {
+        **request.data.model_dump(exclude_unset=True), 'lesson_type': request.lesson_type
+    })
+    
+    # Update progress for every answered word with one read and one batched write
+    results = []
+    for exercise in request.data.exercises:
+        if exercise.word is not None and exercise.is_correct is not None:
+            # Lessons stamp the question type, older clients only send the question text
+            question_type = exercise.question_type or exercise_question_type(exercise.question)
+            results.append((exercise.word, exercise.is_correct, question_type))
+    tutor.update_word_progress_batch(request.user_id, results)
+    
+    # Word progress is committed above; wait for the batched lesson write too before
+    # invalidating, a /podcasts load ahead of the commits would cache the old progress again
+    pending = tutor.firebase.flush()
+    if pending is not None:
+        pending.result()
+    with _podcasts_cache_lock:
+        _podcasts_cache.pop(('progress', request.user_id), None)
+    
+    # "Next Lesson" asks for the same lesson key again, it must not get the finished lesson back
+    forget_user_lessons(request.user_id)
 
 @app.post("/progress")
-async def save_progress(request: ProgressRequest):
+async def save_progress(request: ProgressRequest, tutor: JapaneseTutor = Depends(get_tutor)):
     try:
-        # Save overall lesson progress
-        tutor.save_lesson_progress(request.user_id, request.data, request.lesson_type)
-        
-        # Update progress for each word
-        for exercise in request.data.get('exercises', []):
-            if 'word' in exercise and 'is_correct' in exercise:
-                # Determine question type (meaning or reading)
-                question_type = 'reading' if 'read' in exercise['question'].lower() else 'meaning'
-                tutor.update_word_progress(
-                    request.user_id,
-                    exercise['word'],
-                    exercise['is_correct'],
-                    question_type
-                )
-        
+        # Firestore reads and commits block, keep them off the event loop
+        await run_in_threadpool(_save_progress, tutor, request)
         return {"status": "success"}
     except Exception as e:
-        logger.error(f"Error saving progress: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error saving progress: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/podcasts")
-async def get_podcasts(user_id: str = None):
+async def get_podcasts(request: Request, user_id: str = None):
     """Get all processed podcasts"""
     try:
-        podcasts = []
-        podcast_docs = firebase.db.collection('podcast_lessons').stream()
-        
-        # Get user's word progress if user_id is provided
+        # Load the episode list and the user's word progress concurrently, off the event loop
+        podcasts_load = run_in_threadpool(get_cached_podcast_data, ('podcasts',), _load_podcasts)
         encountered_words = set()
         mastered_words = set()
         if user_id:
-            # Get encountered words
-            word_progress_docs = firebase.db.collection('users').document(user_id).collection('word_progress').stream()
-            encountered_words = {doc.id for doc in word_progress_docs}
-            
-            # Get mastered words - a word is mastered if it has been correctly answered 5 times in a row
-            mastered_docs = firebase.db.collection('users').document(user_id).collection('word_progress').stream()
-            for doc in mastered_docs:
-                data = doc.to_dict()
-                if data.get('meaning_correct_streak', 0) >= 5:
-                    mastered_words.add(doc.id)
+            podcast_list, (encountered_words, mastered_words) = await asyncio.gather(
+                podcasts_load,
+                run_in_threadpool(get_cached_podcast_data, ('progress', user_id), _load_user_progress, user_id)
+            )
+        else:
+            podcast_list = await podcasts_load
         
-        for doc in podcast_docs:
-            data = doc.to_dict()
-            if data:
-                data['id'] = doc.id
-                vocab_items = data.get('vocabulary_items', [])
-                vocab_words = {item['word'] for item in vocab_items}
-                
-                # Calculate encountered and mastered words for this podcast
-                data['wordsEncountered'] = len(vocab_words & encountered_words) if user_id else 0
-                data['wordsMastered'] = len(vocab_words & mastered_words) if user_id else 0
-                data['totalWords'] = len(vocab_items)
-                
-                podcasts.append(data)
+        podcasts = []
+        for data, vocab_words in podcast_list:
+            # Calculate encountered and mastered words for this podcast
+            podcasts.append({
+                **data,
+                'wordsEncountered': len(vocab_words & encountered_words) if user_id else 0,
+                'wordsMastered': len(vocab_words & mastered_words) if user_id else 0,
+                'totalWords': len(data.get('vocabulary_items', [])),
+            })
                 
-        return {"podcasts": podcasts}
+        return conditional_json_response(request, {"podcasts": podcasts})
     except Exception as e:
-        logger.error(f"Error getting podcasts: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error getting podcasts: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
+    # Development only, production runs under gunicorn (see gunicorn.conf.py)
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
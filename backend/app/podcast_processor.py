@@ -1,33 +1,146 @@
 import json
-from typing import List, Dict, Optional
+import orjson
+from typing import BinaryIO, List, Dict, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from firebase_config import FirebaseManager
-from tqdm import tqdm
 from grok_enhanced_tutor import JapaneseTutor
 import re
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
-import whisper
-import tempfile
+import torch
+from faster_whisper import BatchedInferencePipeline, WhisperModel
 import os
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from functools import lru_cache
 from pydub import AudioSegment
 import shutil
-from pydub.utils import which
 from google.cloud import firestore
 from google.api_core import retry
 from google.api_core import exceptions
-import time
+
+# Accepted WHISPER_DEVICE values, auto picks CUDA when torch can see a GPU
+WHISPER_DEVICES = {'auto', 'cpu', 'cuda'}
+
+# Number of VAD speech chunks run through the Whisper encoder per forward pass
+WHISPER_BATCH_SIZE = 16
+
+# Episodes downloaded ahead of transcription, and stored after it, concurrently in process_episodes
+EPISODE_DOWNLOAD_WORKERS = 4
+EPISODE_STORE_WORKERS = 8
+
+# Bytes copied per read when streaming audio previews into ffmpeg
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Retry the episode write on transient contention and availability errors
+EPISODE_WRITE_RETRY = retry.Retry(
+    predicate=retry.if_exception_type(exceptions.Aborted, exceptions.ServiceUnavailable),
+    deadline=60.0
+)
+
+@lru_cache(maxsize=None)
+def load_whisper_model(device: str, compute_type: str, device_index: int = 0,
+                       cpu_threads: int = 0) -> WhisperModel:
+    """Load the Whisper model once per process, shared by every PodcastProcessor"""
+    return WhisperModel("medium", device=device, device_index=device_index, compute_type=compute_type,
+                        cpu_threads=cpu_threads)
+
+# Runs of kanji/kana, allowing a trailing long-vowel mark, used to spot words in a transcript
+_JA_WORD_RE = re.compile(r'[一-龯ぁ-んァ-ン]+ー*[一-龯ぁ-んァ-ン]*')
+# Any kanji, hiragana or katakana character
+_JA_CHAR_RE = re.compile(r'[\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff]')
+# Transcript pieces: one Whisper segment per line, or sentences in older single-line transcripts
+_SENTENCE_RE = re.compile(r'[^\n。！？!?]+[。！？!?]*')
+
+# Common particles and verbs added from any chunk that contains them
+COMMON_WORDS = ("とか", "あと", "何", "その", "ですね", "が", "は", "を", "に", "へ", "で", "から", "まで", "より",
+                "ます", "ました", "です", "でした", "ある", "ない", "なかった", "ありました", "がいます")
+
+# Characters of transcript per vocabulary request; every word comes back as a JSON entry, so
+# larger chunks risk replies cut off at the API's max_tokens
+VOCAB_CHUNK_CHARS = 100
+
+# Per-chunk vocabulary extraction prompt, filled with % (chunk, chunk) so the JSON braces
+# need no escaping
+_VOCAB_PROMPT = """As a Japanese language expert, analyze this short transcript section and create a vocabulary list.
+
+Input transcript section:
+```
+%s
+```
+
+Create a JSON object whose "vocabulary" array contains EVERY word and phrase from the transcript above. Include:
+- Individual words (e.g., こんにちは, 仕事)
+- Particles (は, が, を, etc.)
+- Verb forms (e.g., します)
+- Adjectives (e.g., いい)
+- Common phrases (e.g., よろしく)
+
+Format your response as a JSON object like this:
+{
+    "vocabulary": [
+        {
+            "word": "こんにちは",
+            "reading": "こんにちは",
+            "meaning": "hello, good afternoon",
+            "part_of_speech": "greeting",
+            "importance_level": "1",
+            "importance_reason": "Essential greeting",
+            "context": "%s"
+        }
+    ]
+}
+
+Important: Return ONLY the JSON object with complete entries."""
 
 class PodcastProcessor:
-    def __init__(self, api_key: str, api_provider: str = "openai"):
-        self.firebase = FirebaseManager()
-        self.tutor = JapaneseTutor(api_key, self.firebase, api_provider)
+    def __init__(self, api_key: str, api_provider: str = "openai",
+                 firebase_manager: Optional[FirebaseManager] = None, tutor: Optional[JapaneseTutor] = None):
+        # Reuse the caller's Firebase manager and tutor when given, e.g. the API server's
+        self.firebase = firebase_manager or FirebaseManager()
+        # The tutor is only needed for vocabulary extraction and audio, so build it on first use
+        self._api_key = api_key
+        self._api_provider = api_provider
+        self._tutor = tutor
+        self._tutor_lock = threading.Lock()
+        
+        # Pooled keep-alive connections shared by Spotify API calls and preview downloads
+        self.http = requests.Session()
+        self.http.mount('https://', HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        ))
         
         # Initialize Spotify client
-        self.spotify = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+        self.spotify = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(),
+                                       requests_session=self.http)
         
-        # Initialize Whisper model for transcription
-        self.whisper_model = whisper.load_model("medium")
+        # Initialize Whisper model for transcription (CTranslate2 with int8 weights)
+        cuda_available = torch.cuda.is_available()
+        whisper_device = (os.getenv('WHISPER_DEVICE') or 'auto').strip().lower()
+        if whisper_device not in WHISPER_DEVICES:
+            raise ValueError(f"WHISPER_DEVICE must be one of {', '.join(sorted(WHISPER_DEVICES))}, "
+                             f"got {os.getenv('WHISPER_DEVICE')!r}")
+        if whisper_device == 'auto':
+            whisper_device = "cuda" if cuda_available else "cpu"
+        self.whisper_device = whisper_device
+        use_cuda = self.whisper_device == "cuda"
+        compute_type = "int8_float16" if use_cuda else "int8"
+        # CTranslate2 keeps the features and decoder state on this GPU between steps
+        device_index = int(os.getenv('WHISPER_DEVICE_INDEX', '0'))
+        # On CPU use every core for the int8 kernels, CTranslate2 defaults to 4 threads
+        cpu_threads = 0 if use_cuda else int(os.getenv('WHISPER_CPU_THREADS', os.cpu_count() or 0))
+        print(f"CUDA available: {cuda_available}; running Whisper on {self.whisper_device}"
+              f"{f':{device_index}' if use_cuda else f' with {cpu_threads} threads'} ({compute_type})")
+        self.whisper_model = load_whisper_model(self.whisper_device, compute_type, device_index, cpu_threads)
+        # VAD-split speech chunks are decoded together in batches
+        self.whisper_pipeline = BatchedInferencePipeline(model=self.whisper_model)
         
         # Set ffmpeg paths
         ffmpeg_base_path = r"C:\ffmpeg"
@@ -58,45 +171,62 @@ class PodcastProcessor:
                 "3. Ensure both ffmpeg.exe and ffprobe.exe are in C:\\ffmpeg"
             )
     
-    def convert_to_wav(self, input_path: str) -> str:
-        """Convert audio file to WAV format using pydub"""
-        output_path = input_path.rsplit('.', 1)[0] + '.wav'
+    @property
+    def tutor(self) -> JapaneseTutor:
+        """The JapaneseTutor used for LLM calls and word audio, created on first access"""
+        if self._tutor is None:
+            with self._tutor_lock:
+                if self._tutor is None:
+                    self._tutor = JapaneseTutor(self._api_key, self.firebase, self._api_provider)
+        return self._tutor
+    
+    def _feed_stdin(self, source: BinaryIO, sink: BinaryIO):
+        """Copy source into a subprocess pipe, closing it so the reader sees EOF"""
         try:
-            print(f"Converting {input_path} to WAV format...")
-            
-            # Load the audio file
-            audio = AudioSegment.from_mp3(input_path)
-            
-            # Convert to mono and set sample rate
-            audio = audio.set_channels(1)
-            audio = audio.set_frame_rate(16000)
-            
-            # Export as WAV with explicit parameters
-            audio.export(
-                output_path,
-                format='wav',
-                parameters=[
-                    "-acodec", "pcm_s16le",  # Use standard PCM codec
-                    "-ac", "1",              # mono
-                    "-ar", "16000"           # 16kHz
-                ]
-            )
-            
-            if not os.path.exists(output_path):
-                raise ValueError("WAV file was not created")
-            
-            print(f"Conversion successful. WAV file size: {os.path.getsize(output_path)} bytes")
-            return output_path
-            
-        except Exception as e:
-            print(f"Conversion error: {str(e)}")
-            print(f"Input file exists: {os.path.exists(input_path)}")
-            if os.path.exists(input_path):
-                print(f"Input file size: {os.path.getsize(input_path)} bytes")
-                print(f"Input file permissions: {oct(os.stat(input_path).st_mode)[-3:]}")
-            print(f"Current ffmpeg path: {AudioSegment.converter}")
-            print(f"Current ffprobe path: {AudioSegment.ffprobe}")
-            raise
+            shutil.copyfileobj(source, sink, DOWNLOAD_CHUNK_SIZE)
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg exited early; its stderr carries the reason
+        finally:
+            try:
+                sink.close()
+            except OSError:
+                pass
+    
+    def load_audio(self, source: BinaryIO) -> np.ndarray:
+        """Decode an audio stream to the 16kHz mono float32 array Whisper expects"""
+        cmd = [
+            AudioSegment.converter, "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "s16le", "-acodec", "pcm_s16le",
+            "-ac", "1", "-ar", "16000",
+            "pipe:1"
+        ]
+        # ffmpeg's messages go to a file rather than a pipe: nothing drains a stderr pipe while
+        # stdout is being read, so a chatty decode would fill it and block both processes
+        with tempfile.TemporaryFile() as errors:
+            try:
+                # Feed the compressed audio in on stdin and read raw PCM back, no audio touches disk
+                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errors)
+            except FileNotFoundError:
+                raise ValueError(f"ffmpeg not found at {AudioSegment.converter}, cannot decode podcast audio")
+            # Leaving the block closes the pipes and reaps ffmpeg, even when decoding fails
+            with proc:
+                feeder = threading.Thread(target=self._feed_stdin, args=(source, proc.stdin), daemon=True)
+                feeder.start()
+                try:
+                    samples = proc.stdout.read()
+                except BaseException:
+                    proc.kill()
+                    raise
+                finally:
+                    feeder.join()
+            if proc.returncode != 0:
+                errors.seek(0)
+                raise ValueError(f"Failed to decode audio: {errors.read().decode(errors='replace').strip()}")
+        
+        if not samples:
+            raise ValueError("Decoded audio is empty")
+        return np.frombuffer(samples, dtype=np.int16).astype(np.float32) / 32768.0
     
     def extract_episode_id(self, spotify_url: str) -> str:
         """Extract episode ID from Spotify URL"""
@@ -157,255 +287,198 @@ class PodcastProcessor:
         except Exception as e:
             raise ValueError(f"Failed to fetch episode info: {str(e)}")
     
-    def transcribe_episode(self, episode_id: str) -> str:
-        """Transcribe a Spotify episode using Whisper"""
+    def transcribe_episode(self, episode_id: str, episode_info: Optional[Dict] = None,
+                           episode_doc=None) -> str:
+        """Transcribe a Spotify episode using Whisper, reusing already fetched info and document"""
         # First check if we already have this episode transcribed
-        episode_ref = self.firebase.db.collection('podcast_lessons').document(episode_id)
-        episode_doc = episode_ref.get()
+        if episode_doc is None:
+            episode_doc = self.firebase.db.collection('podcast_lessons').document(episode_id).get()
         
-        if episode_doc.exists:
-            data = episode_doc.to_dict()
-            if data.get('transcript'):
-                return data['transcript']
+        transcript = self._stored_transcript(episode_doc)
+        if transcript:
+            return transcript
         
         # Get episode info and preview URL
-        episode_info = self.get_episode_info(episode_id)
-        preview_url = episode_info.get('preview_url')
+        if episode_info is None:
+            episode_info = self.get_episode_info(episode_id)
         
+        try:
+            # Stored together with the vocabulary by process_spotify_episode
+            return self.transcribe_audio(self.download_audio(episode_info))
+        except Exception as e:
+            print(f"Error during transcription: {str(e)}")
+            raise Exception(f"Error during transcription: {str(e)}")
+    
+    def download_audio(self, episode_info: Dict) -> np.ndarray:
+        """Stream an episode's audio preview straight into the decoder"""
+        preview_url = episode_info.get('preview_url')
         if not preview_url:
             raise ValueError("No preview URL available for this episode. Try another episode.")
         
-        print("Downloading audio preview...")
-        # Download audio preview
-        response = requests.get(preview_url)
-        if response.status_code != 200:
-            raise ValueError(f"Failed to download audio preview (Status code: {response.status_code})")
-        
-        # Create a temporary directory that will persist during transcription
-        temp_dir = tempfile.mkdtemp()
-        mp3_path = os.path.join(temp_dir, f'podcast_{episode_id}.mp3')
-        wav_path = None
-        
+        print("Downloading and decoding audio preview...")
+        with self.http.get(preview_url, stream=True, timeout=60) as response:
+            if response.status_code != 200:
+                raise ValueError(f"Failed to download audio preview (Status code: {response.status_code})")
+            response.raw.decode_content = True
+            audio = self.load_audio(response.raw)
+        print(f"Audio decoded successfully ({len(audio) / 16000:.1f} seconds)")
+        return audio
+    
+    def transcribe_audio(self, audio: np.ndarray) -> str:
+        """Transcribe decoded audio with Whisper"""
+        print("Starting transcription with Whisper...")
         try:
-            # Save the audio file
-            print(f"Saving audio to temporary file: {mp3_path}")
-            with open(mp3_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Verify file exists and has content
-            if not os.path.exists(mp3_path):
-                raise ValueError("Failed to save audio file")
-            
-            file_size = os.path.getsize(mp3_path)
-            print(f"Audio file saved successfully ({file_size} bytes)")
-            
-            # Convert to WAV
-            wav_path = self.convert_to_wav(mp3_path)
-            if not os.path.exists(wav_path):
-                raise ValueError("WAV conversion failed - output file not found")
-            
-            wav_size = os.path.getsize(wav_path)
-            print(f"WAV file created successfully ({wav_size} bytes)")
-            
-            print("Starting transcription with Whisper...")
-            try:
-                result = self.whisper_model.transcribe(
-                    wav_path,
-                    language='ja',
-                    task='transcribe',
-                    fp16=False  # Explicitly disable FP16 to avoid warning
-                )
-                if not result or 'text' not in result:
-                    raise ValueError("Transcription failed - no result returned")
-                    
-                transcript = result['text']
-                print("Transcription complete!")
-                
-                # Store in Firebase
-                episode_ref.set({
-                    'episode_id': episode_id,
-                    'name': episode_info['name'],
-                    'description': episode_info['description'],
-                    'transcript': transcript,
-                    'show_name': episode_info['show_name'],
-                    'show_id': episode_info['show_id'],
-                    'release_date': episode_info['release_date'],
-                    'show_publisher': episode_info['show_publisher'],
-                    'processed_date': firestore.SERVER_TIMESTAMP
-                }, merge=True)
-                
-                return transcript
+            segments, _info = self.whisper_pipeline.transcribe(
+                audio,
+                language='ja',
+                task='transcribe',
+                beam_size=1,
+                vad_filter=True,
+                batch_size=WHISPER_BATCH_SIZE
+            )
+            # Segments are decoded lazily as the generator is consumed
+            # One Whisper segment per line, so vocabulary chunks can follow segment boundaries
+            transcript = '\n'.join(segment.text.strip() for segment in segments)
+            if not transcript:
+                raise ValueError("Transcription failed - no result returned")
                 
-            except Exception as e:
-                print(f"Whisper transcription error: {str(e)}")
-                print(f"WAV file exists: {os.path.exists(wav_path)}")
-                print(f"WAV file size: {os.path.getsize(wav_path) if os.path.exists(wav_path) else 'N/A'}")
-                print(f"WAV file permissions: {oct(os.stat(wav_path).st_mode)[-3:] if os.path.exists(wav_path) else 'N/A'}")
-                raise Exception(f"Whisper transcription failed: {str(e)}")
+            print("Transcription complete!")
+            return transcript
             
         except Exception as e:
-            print(f"Error during transcription: {str(e)}")
-            raise Exception(f"Error during transcription: {str(e)}")
-        finally:
-            # Clean up temp directory and its contents
-            try:
-                if os.path.exists(mp3_path):
-                    os.remove(mp3_path)
-                if wav_path and os.path.exists(wav_path):
-                    os.remove(wav_path)
-                os.rmdir(temp_dir)
-                print("Temporary files cleaned up")
-            except Exception as e:
-                print(f"Warning: Could not remove temporary files: {str(e)}")
-        
-        return None
+            print(f"Whisper transcription error: {str(e)}")
+            print(f"Audio samples: {len(audio)}")
+            raise Exception(f"Whisper transcription failed: {str(e)}")
+
+    @staticmethod
+    def transcript_chunks(transcript: str, max_chars: int = VOCAB_CHUNK_CHARS) -> List[str]:
+        """Group whole transcript segments/sentences into chunks of up to max_chars"""
+        chunks, current = [], ''
+        for piece in _SENTENCE_RE.findall(transcript):
+            piece = piece.strip()
+            if not piece:
+                continue
+            if current and len(current) + len(piece) > max_chars:
+                chunks.append(current)
+                current = ''
+            # A single piece longer than a chunk is cut into fixed windows
+            while len(piece) > max_chars:
+                chunks.append(piece[:max_chars])
+                piece = piece[max_chars:]
+            current += piece
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    @staticmethod
+    def _parse_vocabulary_response(response: str) -> Optional[List]:
+        """Vocabulary array from a chunk response, either a JSON-mode object or text holding an array"""
+        response = response.strip()
+        try:
+            parsed = orjson.loads(response)
+        except orjson.JSONDecodeError:
+            # Not pure JSON: decode the first array in the text without hunting for its end
+            json_start = response.find('[')
+            if json_start < 0:
+                return None
+            parsed, _end = json.JSONDecoder().raw_decode(response, json_start)
+        if isinstance(parsed, dict):
+            parsed = parsed.get('vocabulary')
+        return parsed
 
     def extract_vocabulary(self, transcript: str) -> List[Dict]:
         """Extract vocabulary items from transcript using AI"""
-        import re  # Move import to top of function
-        
-        prompt = """As a Japanese language expert, analyze this short transcript section and create a vocabulary list.
-
-Input transcript section:
-```
-%s
-```
-
-Create a JSON array containing EVERY word and phrase from the transcript above. Include:
-- Individual words (e.g., こんにちは, 仕事)
-- Particles (は, が, を, etc.)
-- Verb forms (e.g., します)
-- Adjectives (e.g., いい)
-- Common phrases (e.g., よろしく)
-
-Format your response as a JSON array like this:
-[
-    {
-        "word": "こんにちは",
-        "reading": "こんにちは",
-        "meaning": "hello, good afternoon",
-        "part_of_speech": "greeting",
-        "importance_level": "1",
-        "importance_reason": "Essential greeting",
-        "context": "%s"
-    }
-]
-
-Important: Return ONLY the JSON array with complete entries."""
-        
-        # Process the transcript in smaller chunks
-        chunk_size = 50  # Smaller chunks for more reliable processing
-        chunks = [transcript[i:i+chunk_size] for i in range(0, len(transcript), chunk_size)]
-        all_vocabulary = []
-        self.vocabulary_list = []  # Global list to track all words
+        # Process the transcript in small chunks of whole segments/sentences
+        chunks = self.transcript_chunks(transcript)
+        # Every word seen so far mapped to its entry, in first-seen order; kept per call so
+        # episodes can be extracted concurrently
+        vocabulary = {}
         
         print(f"\nProcessing transcript in {len(chunks)} chunks...")
         
-        for i, chunk in enumerate(chunks, 1):
-            if not chunk.strip():
-                continue
-                
+        # Send every chunk's prompt concurrently, then parse the responses in chunk order
+        pending = [(i, chunk) for i, chunk in enumerate(chunks, 1) if chunk.strip()]
+        responses = self.tutor.call_api_many([_VOCAB_PROMPT % (chunk, chunk) for _, chunk in pending],
+                                             json_mode=True, return_exceptions=True)
+        
+        for (i, chunk), response in zip(pending, responses):
             print(f"\nProcessing chunk {i}/{len(chunks)}...")
             print(f"Chunk content: {chunk}")
             
-            # Use % formatting instead of template strings to avoid JSON confusion
-            current_prompt = prompt % (chunk, chunk)
-            
             try:
-                response = self.tutor.call_api(current_prompt)
+                if isinstance(response, Exception):
+                    raise response
                 print(f"\nGot response of length: {len(response)}")
                 print(f"Response preview: {response[:200]}")
                 
-                # Clean the response
-                response = response.strip()
-                
-                # Find the complete JSON array
-                json_start = response.find('[')
-                json_end = response.rfind(']') + 1
+                # JSON mode replies are {"vocabulary": [...]}, parsed in a single pass
+                try:
+                    chunk_vocabulary = self._parse_vocabulary_response(response)
+                except json.JSONDecodeError as e:
+                    print(f"JSON parsing error in chunk {i}: {str(e)}")
+                    print(f"Problematic JSON content: {response}")
+                    continue
+                if not isinstance(chunk_vocabulary, list):
+                    print(f"No valid JSON array found in response for chunk {i}")
+                    print(f"Response content: {response}")
+                    continue
                 
-                if json_start >= 0 and json_end > json_start:
-                    try:
-                        json_content = response[json_start:json_end]
-                        
-                        # Validate JSON structure before parsing
-                        open_braces = json_content.count('{')
-                        close_braces = json_content.count('}')
-                        if open_braces != close_braces:
-                            print(f"Mismatched braces: {open_braces} open vs {close_braces} close")
-                            continue
-                            
-                        print("\nExtracted JSON content:")
-                        print(json_content)
-                        
-                        chunk_vocabulary = json.loads(json_content)
-                        if not isinstance(chunk_vocabulary, list):
-                            print(f"Expected JSON array but got {type(chunk_vocabulary)}")
-                            continue
-                        
-                        # Process each word with more lenient validation
-                        extracted_words = []
-                        for word_data in chunk_vocabulary:
-                            if not isinstance(word_data, dict):
-                                continue
-                                
-                            word = word_data.get('word')
-                            if not word:  # Skip entries without a word
-                                continue
-                                
-                            # Skip non-Japanese words
-                            if not any(c for c in word if '\u4e00' <= c <= '\u9fff' or '\u3040' <= c <= '\u309f' or '\u30a0' <= c <= '\u30ff'):
-                                continue
-                                
-                            # Ensure minimum required fields
-                            if 'reading' not in word_data:
-                                word_data['reading'] = word
-                            if 'meaning' not in word_data:
-                                word_data['meaning'] = ''
-                            if 'part_of_speech' not in word_data:
-                                word_data['part_of_speech'] = 'unknown'
-                            if 'importance_level' not in word_data:
-                                word_data['importance_level'] = '3'
-                            if 'importance_reason' not in word_data:
-                                word_data['importance_reason'] = 'Automatically categorized'
-                            if 'context' not in word_data:
-                                word_data['context'] = chunk
-                                
-                            # Add to extracted words for this chunk
-                            extracted_words.append(word_data)
+                # Process each word with more lenient validation
+                extracted_words = []
+                for word_data in chunk_vocabulary:
+                    if not isinstance(word_data, dict):
+                        continue
                         
-                        # Process chunk with duplicate checking and common words
-                        new_words = self.process_chunk(chunk, extracted_words, self.vocabulary_list)
+                    word = word_data.get('word')
+                    if not word:  # Skip entries without a word
+                        continue
                         
-                        if new_words:
-                            print(f"Added {len(new_words)} new words from chunk {i}")
-                            print("New words:", ", ".join(new_words))
+                    # Skip non-Japanese words
+                    if not _JA_CHAR_RE.search(word):
+                        continue
                         
-                        # Show words that might have been missed
-                        chunk_words = re.findall(r'[一-龯ぁ-んァ-ン]+[ー]*[一-龯ぁ-んァ-ン]*', chunk)
-                        missed_words = [w for w in chunk_words if w not in new_words and w not in [v['word'] for v in self.vocabulary_list]]
-                        if missed_words:
-                            print("\nPotentially missed words:")
-                            print(", ".join(missed_words))
+                    # Ensure minimum required fields
+                    if 'reading' not in word_data:
+                        word_data['reading'] = word
+                    if 'meaning' not in word_data:
+                        word_data['meaning'] = ''
+                    if 'part_of_speech' not in word_data:
+                        word_data['part_of_speech'] = 'unknown'
+                    if 'importance_level' not in word_data:
+                        word_data['importance_level'] = '3'
+                    if 'importance_reason' not in word_data:
+                        word_data['importance_reason'] = 'Automatically categorized'
+                    if 'context' not in word_data:
+                        word_data['context'] = chunk
                         
-                    except json.JSONDecodeError as e:
-                        print(f"JSON parsing error in chunk {i}: {str(e)}")
-                        print(f"Problematic JSON content: {json_content}")
-                        continue
-                else:
-                    print(f"No valid JSON array found in response for chunk {i}")
-                    print(f"Response content: {response}")
-                    continue
+                    # Add to extracted words for this chunk
+                    extracted_words.append(word_data)
+                
+                # Process chunk with duplicate checking and common words
+                new_words = self.process_chunk(chunk, extracted_words, vocabulary)
+                
+                if new_words:
+                    print(f"Added {len(new_words)} new words from chunk {i}")
+                    print("New words:", ", ".join(new_words))
                 
+                # Show words that might have been missed
+                chunk_words = _JA_WORD_RE.findall(chunk)
+                missed_words = [w for w in chunk_words if w not in vocabulary]
+                if missed_words:
+                    print("\nPotentially missed words:")
+                    print(", ".join(missed_words))
+                
+            
             except Exception as e:
                 print(f"Error processing chunk {i}: {str(e)}")
                 continue
         
         # Use the vocabulary list we've built up
-        all_vocabulary = self.vocabulary_list
+        all_vocabulary = list(vocabulary.values())
         
         if not all_vocabulary:
             print("\nNo vocabulary extracted through AI. Using fallback method...")
-            words = re.findall(r'[一-龯ぁ-んァ-ン]+[ー]*[一-龯ぁ-んァ-ン]*', transcript)
+            words = _JA_WORD_RE.findall(transcript)
             for word in set(words):
                 word_data = {
                     "word": word,
@@ -441,13 +514,13 @@ Important: Return ONLY the JSON array with complete entries."""
         
         return all_vocabulary
 
-    def process_chunk(self, chunk, extracted_words, vocabulary_list):
+    def process_chunk(self, chunk, extracted_words, vocabulary):
         """Process a chunk of text, checking for duplicates and common words
         
         Args:
             chunk: The text chunk to process
             extracted_words: List of word dictionaries from AI extraction
-            vocabulary_list: Global list of all words seen so far
+            vocabulary: Dict of every word seen so far to its entry, in first-seen order
             
         Returns:
             List of new words added from this chunk
@@ -456,16 +529,13 @@ Important: Return ONLY the JSON array with complete entries."""
         new_words = []
         for word_data in extracted_words:
             word = word_data['word']
-            if word not in [w['word'] for w in vocabulary_list]:
+            if word not in vocabulary:
                 new_words.append(word)
-                vocabulary_list.append(word_data)
+                vocabulary[word] = word_data
         
-        # Add common particles and verbs
-        common_words = ["とか", "あと", "何", "その", "ですね", "が", "は", "を", "に", "へ", "で", "から", "まで", "より", 
-                       "ます", "ました", "です", "でした", "ある", "ない", "なかった", "ありました", "がいます"]
-        
-        for word in common_words:
-            if word in chunk and word not in [w['word'] for w in vocabulary_list]:
+        # Add common particles and verbs; the dict check first skips the substring scan once seen
+        for word in COMMON_WORDS:
+            if word not in vocabulary and word in chunk:
                 # Create a basic word entry for common words
                 word_data = {
                     "word": word,
@@ -477,82 +547,156 @@ Important: Return ONLY the JSON array with complete entries."""
                     "context": chunk
                 }
                 new_words.append(word)
-                vocabulary_list.append(word_data)
+                vocabulary[word] = word_data
         
         return new_words
 
+    def _prepare_episode(self, spotify_url: str):
+        """Resolve an episode URL to its id, document and, if already processed, its cached result"""
+        # Extract episode ID and get transcript
+        episode_id = self.extract_episode_id(spotify_url)
+        
+        # Check if we already have this episode processed
+        episode_ref = self.firebase.db.collection('podcast_lessons').document(episode_id)
+        episode_doc = episode_ref.get()
+        
+        if episode_doc.exists:
+            data = episode_doc.to_dict()
+            if data.get('transcript') and data.get('vocabulary_items'):
+                print("Found existing processed episode, returning cached data")
+                return episode_id, episode_ref, episode_doc, {
+                    'episode_id': episode_id,
+                    'vocabulary': JapaneseTutor.episode_vocabulary(data),
+                    'transcript': data['transcript']
+                }
+        return episode_id, episode_ref, episode_doc, None
+    
+    @staticmethod
+    def _stored_transcript(episode_doc) -> Optional[str]:
+        """Transcript already saved on an episode document snapshot, if any"""
+        return episode_doc.to_dict().get('transcript') if episode_doc.exists else None
+    
+    def _store_episode(self, episode_id: str, episode_ref, episode_info: Dict, transcript: str,
+                       transcript_stored: bool = False) -> Dict:
+        """Extract a transcript's vocabulary, generate its audio and store the processed episode"""
+        print("Extracting vocabulary...")
+        vocabulary = self.extract_vocabulary(transcript)
+        if not vocabulary:
+            raise ValueError("Failed to extract vocabulary from transcript")
+        
+        # Generate audio URLs for all vocabulary items first
+        print("Generating audio URLs for vocabulary items...")
+        missing = [word_data for word_data in vocabulary if not word_data.get('audio_url')]
+        audio_urls = self.tutor.generate_audio_many([word_data['word'] for word_data in missing])
+        for word_data in missing:
+            audio_url = audio_urls.get(word_data['word'])
+            if audio_url:
+                word_data['audio_url'] = audio_url
+        
+        # Store complete data in Firebase with a single merge operation
+        episode_data = {
+            'episode_id': episode_id,
+            'vocabulary_items': vocabulary,
+            # Distinct words for the /podcasts progress counts
+            'vocabulary_words': list(dict.fromkeys(word_data['word'] for word_data in vocabulary)),
+            'processed_date': firestore.SERVER_TIMESTAMP,
+            'name': episode_info['name'],
+            'description': episode_info['description'],
+            'show_name': episode_info['show_name'],
+            'show_id': episode_info['show_id'],
+            'show_publisher': episode_info['show_publisher'],
+            'release_date': episode_info['release_date'],
+            'image_url': episode_info.get('image_url')  # Include the image URL
+        }
+        if not transcript_stored:
+            # Only sent when new, a stored transcript is not written back unchanged
+            episode_data['transcript'] = transcript
+        episode_ref.set(episode_data, merge=True, retry=EPISODE_WRITE_RETRY)
+        
+        print("Episode processing complete!")
+        return {
+            'episode_id': episode_id,
+            'vocabulary': vocabulary,
+            'transcript': transcript,
+            'image_url': episode_info.get('image_url')  # Include the image URL in the response
+        }
+    
     def process_spotify_episode(self, spotify_url: str) -> Dict:
         """Process a Spotify podcast episode and create a lesson"""
         print(f"Processing Spotify episode URL: {spotify_url}")
         
         try:
-            # Extract episode ID and get transcript
-            episode_id = self.extract_episode_id(spotify_url)
-            
-            # Check if we already have this episode processed
-            episode_ref = self.firebase.db.collection('podcast_lessons').document(episode_id)
-            episode_doc = episode_ref.get()
-            
-            if episode_doc.exists:
-                data = episode_doc.to_dict()
-                if data.get('transcript') and data.get('vocabulary_items'):
-                    print("Found existing processed episode, returning cached data")
-                    return {
-                        'episode_id': episode_id,
-                        'vocabulary': data['vocabulary_items'],
-                        'transcript': data['transcript']
-                    }
+            episode_id, episode_ref, episode_doc, cached = self._prepare_episode(spotify_url)
+            if cached:
+                return cached
             
             print("Starting new episode processing...")
             # Get episode info first to have access to metadata
             episode_info = self.get_episode_info(episode_id)
-            transcript = self.transcribe_episode(episode_id)
+            transcript_stored = bool(self._stored_transcript(episode_doc))
+            transcript = self.transcribe_episode(episode_id, episode_info, episode_doc)
             if not transcript:
                 raise ValueError("Failed to get transcript from episode")
             
-            print("Extracting vocabulary...")
-            vocabulary = self.extract_vocabulary(transcript)
-            if not vocabulary:
-                raise ValueError("Failed to extract vocabulary from transcript")
-            
-            # Generate audio URLs for all vocabulary items first
-            print("Generating audio URLs for vocabulary items...")
-            for word_data in vocabulary:
-                word = word_data['word']
-                if not word_data.get('audio_url'):
-                    audio_url = self.tutor.generate_audio(word)
-                    if audio_url:
-                        word_data['audio_url'] = audio_url
-            
-            # Store complete data in Firebase with a single merge operation
-            episode_ref.set({
-                'vocabulary_items': vocabulary,
-                'processed_date': firestore.SERVER_TIMESTAMP,
-                'name': episode_info['name'],
-                'description': episode_info['description'],
-                'show_name': episode_info['show_name'],
-                'show_publisher': episode_info['show_publisher'],
-                'release_date': episode_info['release_date'],
-                'image_url': episode_info.get('image_url'),  # Include the image URL
-                'transcript': transcript
-            }, merge=True)
-            
-            print("Episode processing complete!")
-            return {
-                'episode_id': episode_id,
-                'vocabulary': vocabulary,
-                'transcript': transcript,
-                'image_url': episode_info.get('image_url')  # Include the image URL in the response
-            }
+            return self._store_episode(episode_id, episode_ref, episode_info, transcript, transcript_stored)
             
         except Exception as e:
             print(f"Error processing episode: {str(e)}")
             raise
+    
+    def _fetch_episode(self, spotify_url: str):
+        """First process_episodes stage: look up an episode and download audio still to transcribe"""
+        episode_id, episode_ref, episode_doc, cached = self._prepare_episode(spotify_url)
+        if cached:
+            return cached, None
+        episode_info = self.get_episode_info(episode_id)
+        transcript = self._stored_transcript(episode_doc)
+        audio = None if transcript else self.download_audio(episode_info)
+        return None, (episode_id, episode_ref, episode_info, transcript, audio)
+    
+    def process_episodes(self, spotify_urls: List[str]) -> List[Dict]:
+        """Process several episodes, overlapping downloads, transcription and vocabulary extraction
+        
+        Downloads run ahead on one thread pool and vocabulary extraction plus storage on another,
+        while this thread runs Whisper on one episode at a time. Returns the results of the
+        episodes that succeeded, in input order.
+        """
+        stages = []
+        with ThreadPoolExecutor(max_workers=EPISODE_DOWNLOAD_WORKERS) as download_pool, \
+                ThreadPoolExecutor(max_workers=EPISODE_STORE_WORKERS) as store_pool:
+            downloads = [download_pool.submit(self._fetch_episode, url) for url in spotify_urls]
+            for spotify_url, download in zip(spotify_urls, downloads):
+                try:
+                    cached, episode = download.result()
+                    if cached:
+                        stages.append((spotify_url, cached))
+                        continue
+                    episode_id, episode_ref, episode_info, transcript, audio = episode
+                    transcript_stored = bool(transcript)
+                    if not transcript_stored:
+                        transcript = self.transcribe_audio(audio)
+                    stages.append((spotify_url, store_pool.submit(
+                        self._store_episode, episode_id, episode_ref, episode_info, transcript, transcript_stored
+                    )))
+                except Exception as e:
+                    print(f"Error processing episode {spotify_url}: {str(e)}")
+            
+            results = []
+            for spotify_url, result in stages:
+                try:
+                    results.append(result.result() if isinstance(result, Future) else result)
+                except Exception as e:
+                    print(f"Error processing episode {spotify_url}: {str(e)}")
+        return results
+
+
+def process_all_episodes(api_key: str, spotify_urls: List[str], api_provider: str = "openai") -> List[Dict]:
+    """Process a list of Spotify episode URLs with one shared PodcastProcessor"""
+    return PodcastProcessor(api_key, api_provider).process_episodes(spotify_urls)
 
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
-    import os
     
     load_dotenv()
     
@@ -0,0 +1,81 @@
+import importlib
+import json
+import pathlib
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'app'))
+
+# Services and ML backends the processor imports but vocabulary extraction never touches
+_EXTERNAL_MODULES = [
+    'aiohttp', 'cachetools', 'requests', 'requests.adapters', 'urllib3', 'urllib3.util',
+    'urllib3.util.retry', 'firebase_admin', 'google', 'google.api_core', 'google.cloud',
+    'dotenv', 'spotipy', 'spotipy.oauth2', 'torch', 'faster_whisper', 'pydub',
+]
+
+
+@pytest.fixture(scope='module')
+def podcast_processor():
+    """podcast_processor, with any external module that is not installed replaced by a mock"""
+    stubs = {}
+    for name in _EXTERNAL_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            stubs[name] = mock.MagicMock(name=name)
+    with mock.patch.dict(sys.modules, stubs):
+        for name in ('podcast_processor', 'grok_enhanced_tutor', 'firebase_config'):
+            sys.modules.pop(name, None)
+        yield importlib.import_module('podcast_processor')
+
+
+class StubTutor:
+    """Answers each vocabulary prompt with one JSON-mode entry per Japanese word in its chunk"""
+
+    def __init__(self, module):
+        self.module = module
+        self.prompts = []
+
+    def call_api_many(self, prompts, json_mode=False, return_exceptions=False):
+        self.prompts.extend(prompts)
+        replies = []
+        for prompt in prompts:
+            chunk = prompt.split('```\n', 1)[1].split('\n```', 1)[0]
+            words = self.module._JA_WORD_RE.findall(chunk)
+            replies.append(json.dumps({'vocabulary': [
+                {'word': word, 'meaning': f'meaning of {word}', 'importance_level': '1'} for word in words
+            ]}))
+        return replies
+
+
+def make_processor(module, tutor):
+    processor = module.PodcastProcessor.__new__(module.PodcastProcessor)
+    processor._tutor = tutor
+    return processor
+
+
+def test_transcript_chunks_follow_segment_boundaries(podcast_processor):
+    transcript = "こんにちは。今日はいい天気ですね！\n元気ですか？"
+
+    chunks = podcast_processor.PodcastProcessor.transcript_chunks(transcript, max_chars=12)
+
+    assert chunks == ["こんにちは。", "今日はいい天気ですね！", "元気ですか？"]
+
+
+def test_extract_vocabulary_end_to_end(podcast_processor):
+    tutor = StubTutor(podcast_processor)
+    processor = make_processor(podcast_processor, tutor)
+
+    vocabulary = processor.extract_vocabulary("猫です。\n犬です。\n猫が好き")
+
+    assert tutor.prompts, "the tutor should be asked for the transcript's vocabulary"
+    words = [entry['word'] for entry in vocabulary]
+    assert len(words) == len(set(words))
+    assert {'猫です', '犬です', '猫が好き'} <= set(words)
+    # Common words found in the transcript are added even when the reply misses them
+    assert 'です' in words
+    extracted = next(entry for entry in vocabulary if entry['word'] == '猫です')
+    assert extracted['reading'] == '猫です'
+    assert extracted['context'] == "猫です。犬です。猫が好き"
@@ -30,6 +30,7 @@ interface LessonContentProps {
     word: string;
     is_correct: boolean;
     question: string;
+    question_type?: string;
   }>) => void;
 }
 
@@ -43,6 +44,7 @@ export function LessonContent({ lesson, onComplete }: LessonContentProps) {
     word: string;
     is_correct: boolean;
     question: string;
+    question_type?: string;
   }>>([]);
 
   if (!lesson || !lesson.exercises || lesson.exercises.length === 0) {
@@ -67,7 +69,8 @@ export function LessonContent({ lesson, onComplete }: LessonContentProps) {
     setExerciseResults(prev => [...prev, {
       word: currentQuestion.word,
       is_correct: isCorrect,
-      question: currentQuestion.question
+      question: currentQuestion.question,
+      question_type: currentQuestion.question_type
     }]);
   };
 
@@ -2,6 +2,9 @@ import axios from 'axios';
 
 const API_BASE_URL = 'http://localhost:8000';
 
+// Give up polling a podcast job that hasn't finished after this long
+const PODCAST_JOB_TIMEOUT_MS = 60 * 60 * 1000;
+
 export interface LessonData {
     exercises: Array<{
         type: string;
@@ -11,6 +14,7 @@ export interface LessonData {
         question: string;
         options: string[];
         correct: string;
+        question_type?: string;
         context?: string;
         context_en?: string;
         audio_url?: string;
@@ -31,6 +35,7 @@ export interface ProgressData {
         word: string;
         is_correct: boolean;
         question: string;
+        question_type?: string;
     }>;
 }
 
@@ -66,13 +71,30 @@ export const api = {
         return response.data;
     },
 
-    // Process a Spotify podcast
+    // Process a Spotify podcast (queued on the backend, polls until the job is done)
     processSpotifyPodcast: async (userId: string, spotifyUrl: string) => {
         const response = await axios.post(`${API_BASE_URL}/process-spotify-podcast`, {
             user_id: userId,
             spotify_url: spotifyUrl
         });
-        return response.data;
+        const jobId = response.data.job_id;
+        const deadline = Date.now() + PODCAST_JOB_TIMEOUT_MS;
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, 3000));
+            const job = await axios.get(`${API_BASE_URL}/process-spotify-podcast/${jobId}`, {
+                validateStatus: status => status === 200 || status === 404
+            });
+            if (job.status === 404) {
+                throw new Error('Podcast job not found, please submit the episode again');
+            }
+            if (job.data.status === 'finished') {
+                return { status: 'success', episode_id: job.data.episode_id };
+            }
+            if (job.data.status === 'failed') {
+                throw new Error(job.data.error || 'Podcast processing failed');
+            }
+        }
+        throw new Error('Timed out waiting for podcast processing');
     },
 
     // Save lesson progress